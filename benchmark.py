@@ -0,0 +1,518 @@
+#!/usr/bin/env python
+
+"""
+Benchmark of the prm and LandingZone generation with synthetic tables and an in-memory fake database
+"""
+
+from contextlib import redirect_stdout
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import zlib
+
+import common
+import gen_ldz
+import gen_prms
+import metadata
+
+
+"""
+Constants
+"""
+DEFAULT_SIZES = [1000, 10000]
+NUMBER_OF_OWNERS = 10
+LAST_DDL_TIME = datetime.datetime(2024, 1, 1)
+BENCH_ENV = "bench"
+# python overhead allowed for the import of gg.py, without the http client
+IMPORT_BUDGET_MS = 100
+IMPORT_REPEAT = 5
+# stage -> imported modules
+IMPORT_STAGES = {
+    "import_gg": "gg",
+    "import_gg_with_requests": "gg, requests",
+}
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+COLUMN_TYPES = [
+    ("VARCHAR2", 100),
+    ("NUMBER", 22),
+    ("DATE", 7),
+    ("VARCHAR2", 4000),
+    ("TIMESTAMP(6)", 11),
+]
+
+
+"""
+returns the name of the owner and of the table number table_index
+"""
+
+
+def gen_table_name(table_index: int) -> tuple[str, str]:
+    return f"OWNER{table_index % NUMBER_OF_OWNERS}", f"T{table_index:07d}"
+
+
+"""
+returns the synthetic columns of a table, some tables have long varchar2, raw and lob columns
+"""
+
+
+def gen_table_columns(table_name: str) -> list[tuple[str, str, int]]:
+    table_index = int(table_name[1:])
+    columns = [
+        (f"COL{column_index}",) + COLUMN_TYPES[column_index % len(COLUMN_TYPES)]
+        for column_index in range(5 + table_index % 20)
+    ]
+    if table_index % 7 == 0:
+        columns.append(("LONG_VARCHAR2", "VARCHAR2", 32767))
+    if table_index % 11 == 0:
+        columns.append(("LONG_RAW", "RAW", 32767))
+    if table_index % 5 == 0:
+        columns.append(("DOC", "CLOB", 4000))
+    if table_index % 13 == 0:
+        columns.append(("IMAGE", "BLOB", 4000))
+    return columns
+
+
+"""
+writes the synthetic tables and lobs files, every lob of every second table is in the lobs file
+"""
+
+
+def gen_input_files(work_dir: str, size: int) -> tuple[str, str]:
+    tables_fn = os.path.join(work_dir, f"tables_{size}.csv")
+    lobs_fn = os.path.join(work_dir, f"lobs_{size}.csv")
+    with open(tables_fn, "w") as tables_fh, open(lobs_fn, "w") as lobs_fh:
+        for table_index in range(size):
+            owner, table_name = gen_table_name(table_index)
+            tables_fh.write(f"{owner},{table_name}\n")
+            if table_index % 2 == 0:
+                for column_name, data_type, _ in gen_table_columns(table_name):
+                    if data_type in ("CLOB", "BLOB"):
+                        lobs_fh.write(f"{owner},{table_name},{column_name},{data_type}\n")
+    return tables_fn, lobs_fn
+
+
+"""
+in-memory replacement of lazydb.LazyDb, answers the dictionary queries of the generators
+every call counts as a round trip and waits latency_ms
+"""
+
+
+class FakeLazyDb:
+    def __init__(self, latency_ms: float = 0):
+        self.latency = latency_ms / 1000
+        self.round_trips = 0
+        self.lock = threading.Lock()
+
+    """
+    """
+
+    def execute_sql(
+        self, sql=None, sql_fn=None, bind_data=None, fetch_only_one=False, **kwargs
+    ):
+        with self.lock:
+            self.round_trips += 1
+        if self.latency:
+            time.sleep(self.latency)
+        sql_text = sql or sql_fn
+        bind_data = bind_data or {}
+        table_names = [
+            value for bind_name, value in bind_data.items() if bind_name != "owner"
+        ]
+        if "gen_create_table" in sql_text:
+            columns = gen_table_columns(bind_data["table_name"])
+            rows = [
+                (
+                    f"CREATE TABLE {bind_data['table_name']} ("
+                    + ", ".join(f"{name} {data_type}" for name, data_type, _ in columns)
+                    + ")",
+                )
+            ]
+        elif "dba_tab_columns" in sql_text:
+            rows = [
+                (table_name,) + column
+                for table_name in sorted(table_names)
+                for column in gen_table_columns(table_name)
+            ]
+        elif "dba_objects" in sql_text:
+            rows = [(table_name, LAST_DDL_TIME) for table_name in table_names]
+        elif "dba_segments" in sql_text or "dba_tab_modifications" in sql_text:
+            rows = [
+                (table_name, zlib.crc32(table_name.encode()) % 1000000)
+                for table_name in table_names
+            ]
+        else:
+            raise Exception(f"unexpected sql: {sql_text}")
+        if fetch_only_one:
+            return rows[0] if rows else None
+        return rows
+
+    """
+    """
+
+    def iter_sql(self, sql=None, sql_fn=None, bind_data=None, **kwargs):
+        yield from self.execute_sql(sql=sql, sql_fn=sql_fn, bind_data=bind_data)
+
+
+"""
+returns the configuration of the benchmark environment
+"""
+
+
+def gen_config(work_dir: str, tables_fn: str, lobs_fn: str) -> dict:
+    templates_dir = os.path.join(REPO_DIR, "j2")
+    return {
+        "default_max_number_lines_per_default_tables_prm": 100000,
+        "default_templates": {
+            "extract": {
+                "process": os.path.join(templates_dir, "extract.j2"),
+                "process_tables": os.path.join(templates_dir, "ext_table.j2"),
+            },
+            "replicat": {
+                "process": os.path.join(templates_dir, "replicat.j2"),
+                "process_tables": os.path.join(templates_dir, "rep_table.j2"),
+            },
+        },
+        "metadata_cache_dir": os.path.join(work_dir, "cache"),
+        BENCH_ENV: {
+            "source_db": {"dsn": "BENCH_SRC", "user": "BENCH"},
+            "target_db": {"dsn": "BENCH_TGT", "user": "BENCH", "owner": "LDZ"},
+            "tables_file": tables_fn,
+            "lobs_file": lobs_fn,
+            "trail": "es",
+            "processes": {
+                "extract": {
+                    "process_name": "EXT",
+                    "credential_name": "BENCH_SRC",
+                    "prm_file_name": "EXT.prm",
+                    "prm_table_file_name_pattern": "EXT_TABLES_{n}.prm",
+                },
+                "replicat": {
+                    "process_name": "REP",
+                    "credential_name": "BENCH_TGT",
+                    "prm_file_name": "REP.prm",
+                    "prm_table_file_name_pattern": "REP_TABLES_{n}.prm",
+                },
+            },
+        },
+    }
+
+
+"""
+returns the duration, round trips and peak memory of a stage, prepare returns the function to measure
+the duration and the round trips come from a pass without tracemalloc, which slows down every allocation,
+the peak memory from a second pass with tracemalloc, prepare is called before each pass to reset the state
+"""
+
+
+def measure(stage: str, size: int, fake_db: FakeLazyDb, prepare) -> dict:
+    func = prepare()
+    round_trips = fake_db.round_trips
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        func()
+    seconds = time.perf_counter() - start
+    round_trips = fake_db.round_trips - round_trips
+    func = prepare()
+    tracemalloc.start()
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        func()
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "stage": stage,
+        "size": size,
+        "seconds": round(seconds, 4),
+        "round_trips": round_trips,
+        "peak_memory_mb": round(peak_bytes / 1024 / 1024, 2),
+    }
+
+
+"""
+runs all stages for the given number of tables
+"""
+
+
+def bench_size(work_dir: str, size: int, latency_ms: float, workers: int) -> list:
+    size_dir = os.path.join(work_dir, str(size))
+    common.checkDir(size_dir)
+    os.chdir(size_dir)
+    tables_fn, lobs_fn = gen_input_files(size_dir, size)
+    config = gen_config(size_dir, tables_fn, lobs_fn)
+    fake_db = FakeLazyDb(latency_ms)
+    results = []
+    metadata_cache_fn = os.path.join(
+        config["metadata_cache_dir"], metadata.METADATA_CACHE_FILE_NAME
+    )
+    # the caches opened for the LandingZone stages, closed before the cache file is removed
+    metadata_caches = []
+
+    def remove_metadata_cache():
+        while metadata_caches:
+            metadata_caches.pop().close()
+        if os.path.exists(metadata_cache_fn):
+            os.remove(metadata_cache_fn)
+
+    def prepare_gen_prms(use_metadata_cache, cold=False):
+        if cold:
+            remove_metadata_cache()
+        return lambda: gen_prms.gen_prms(
+            config,
+            BENCH_ENV,
+            use_metadata_cache=use_metadata_cache,
+            workers=workers,
+            source_db_conn=fake_db,
+        )
+
+    results.append(
+        measure("gen_prms_no_cache", size, fake_db, lambda: prepare_gen_prms(False))
+    )
+    results.append(
+        measure("gen_prms_cold", size, fake_db, lambda: prepare_gen_prms(True, True))
+    )
+    results.append(
+        measure("gen_prms_warm", size, fake_db, lambda: prepare_gen_prms(True))
+    )
+
+    # the stages of the extract generation
+    prm_generator = gen_prms.PrmGenerator(
+        "extract", config[BENCH_ENV], fake_db, workers=workers
+    )
+
+    def prepare_load_table_columns():
+        prm_generator.table_columns.columns.clear()
+        return lambda: prm_generator.table_columns.load(prm_generator.tables.tables)
+
+    results.append(
+        measure("load_table_columns", size, fake_db, prepare_load_table_columns)
+    )
+    results.append(
+        measure(
+            "generate_process_tables_prm",
+            size,
+            fake_db,
+            lambda: prm_generator.generate_process_tables_prm,
+        )
+    )
+    j2_table_template = common.read_j2_template(
+        config["default_templates"]["extract"]["process_tables"]
+    )
+    results.append(
+        measure(
+            "write_tables_prm",
+            size,
+            fake_db,
+            lambda: lambda: prm_generator.write_tables_prm(
+                [],
+                (
+                    j2_table_template.render(
+                        {"source_owner": table.owner, "table_name": table.table_name}
+                    )
+                    for table in prm_generator.tables.tables
+                ),
+            ),
+        )
+    )
+
+    # the LandingZone generation, sql/gen_create_table.sql is only read for the cache key
+    common.checkDir("sql")
+    common.write_text_to_file(gen_ldz.GEN_CREATE_TABLE_SQL_FN, "-- benchmark\n")
+
+    def prepare_ldz_gen_tables(cold):
+        if cold:
+            remove_metadata_cache()
+        metadata_cache = metadata.MetadataCache(
+            fake_db, "BENCH_SRC", config["metadata_cache_dir"], workers=workers
+        )
+        metadata_caches.append(metadata_cache)
+        ldz_generator = gen_ldz.LdzGenerator(
+            fake_db, tables_fn, lobs_fn, False, metadata_cache
+        )
+        return lambda: ldz_generator.gen_tables(None)
+
+    results.append(
+        measure(
+            "ldz_gen_tables_cold",
+            size,
+            fake_db,
+            lambda: prepare_ldz_gen_tables(True),
+        )
+    )
+    results.append(
+        measure(
+            "ldz_gen_tables_warm",
+            size,
+            fake_db,
+            lambda: prepare_ldz_gen_tables(False),
+        )
+    )
+    while metadata_caches:
+        metadata_caches.pop().close()
+
+    def prepare_ldz_gen_drop_lobs():
+        ldz_generator = gen_ldz.LdzGenerator(fake_db, tables_fn, lobs_fn, False)
+        return lambda: ldz_generator.gen_drop_lobs(None)
+
+    results.append(
+        measure("ldz_gen_drop_lobs", size, fake_db, prepare_ldz_gen_drop_lobs)
+    )
+    return results
+
+
+"""
+measures the import time of the scripts in a new interpreter, the best of IMPORT_REPEAT runs is kept
+"""
+
+
+def bench_imports() -> list:
+    results = []
+    for stage, modules in IMPORT_STAGES.items():
+        timings = []
+        for _ in range(IMPORT_REPEAT):
+            output = subprocess.run(
+                [
+                    sys.executable,
+                    "-c",
+                    f"import time; start = time.perf_counter(); import {modules}; print(time.perf_counter() - start)",
+                ],
+                cwd=REPO_DIR,
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+            timings.append(float(output))
+        results.append(
+            {
+                "stage": stage,
+                "size": 0,
+                "seconds": round(min(timings), 4),
+                "round_trips": 0,
+                "peak_memory_mb": 0,
+            }
+        )
+    return results
+
+
+"""
+prints the ratio of the durations against the results of a previous run
+"""
+
+
+def compare_results(results: list, baseline_results: list):
+    baseline = {
+        (result["stage"], result["size"]): result for result in baseline_results
+    }
+    for result in results:
+        previous = baseline.get((result["stage"], result["size"]))
+        if previous and previous["seconds"]:
+            print(
+                f"{result['stage']:<30} {result['size']:>8} {previous['seconds']:>10} -> {result['seconds']:>10} ({result['seconds'] / previous['seconds']:.2f}x)"
+            )
+
+
+"""
+initializes argparse
+"""
+
+
+def init_argparse() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="""
+Benchmark of gen_prms.py and gen_ldz.py with synthetic tables and a fake database
+""",
+        formatter_class=argparse.RawTextHelpFormatter,
+        epilog="""
+Example 1: benchmark with 1000 and 10000 tables
+
+    ./benchmark.py
+
+Example 2: benchmark with 100000 tables, 2 ms latency per round trip and compare with a previous run
+
+    ./benchmark.py --sizes 100000 --latency_ms 2 --baseline bench_results_old.json
+""",
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=DEFAULT_SIZES,
+        help="number of tables of each run",
+    )
+    parser.add_argument(
+        "--latency_ms",
+        type=float,
+        default=0,
+        help="latency of every round trip to the fake database",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1, help="number of threads of the generators"
+    )
+    parser.add_argument(
+        "--output", default="bench_results.json", help="result file (json)"
+    )
+    parser.add_argument("--baseline", help="result file of a previous run to compare")
+    parser.add_argument(
+        "--work_dir", help="directory for the generated files, default is a temp dir"
+    )
+    parser.add_argument(
+        "--import_budget_ms",
+        type=float,
+        default=IMPORT_BUDGET_MS,
+        help="maximum import time of gg.py, the benchmark fails if it is exceeded",
+    )
+    return parser
+
+
+"""
+main
+"""
+
+
+def main():
+    parser = init_argparse()
+    args = parser.parse_args()
+    output_fn = os.path.abspath(args.output)
+    baseline_fn = os.path.abspath(args.baseline) if args.baseline else None
+    with tempfile.TemporaryDirectory() as temp_dir:
+        work_dir = os.path.abspath(args.work_dir) if args.work_dir else temp_dir
+        common.checkDir(work_dir)
+        results = bench_imports()
+        for result in results:
+            print(json.dumps(result))
+        for size in args.sizes:
+            for result in bench_size(work_dir, size, args.latency_ms, args.workers):
+                print(json.dumps(result))
+                results.append(result)
+        os.chdir(REPO_DIR)
+    common.write_json(
+        {
+            "python": platform.python_version(),
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "latency_ms": args.latency_ms,
+            "workers": args.workers,
+            "results": results,
+        },
+        output_fn,
+    )
+    if baseline_fn:
+        compare_results(results, common.read_json(baseline_fn)["results"])
+    import_ms = results[0]["seconds"] * 1000
+    if import_ms > args.import_budget_ms:
+        print(
+            f"import of gg.py took {import_ms:.0f} ms, budget is {args.import_budget_ms:.0f} ms"
+        )
+        sys.exit(1)
+
+
+"""
+"""
+if __name__ == "__main__":
+    main()
@@ -4,21 +4,24 @@
 Script to generate sql for the LandingZone
 """
 
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
 
 import datetime
-import jinja2
+import filecmp
+import functools
+import graphlib
+import heapq
 import json
 import logging
-import mimetypes
 import os
-import smtplib
+import random
 import sys
+import time
 
-from email import encoders
-from email.mime.base import MIMEBase
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
+# jinja2, smtplib and email are imported by the functions using them, they are slow to import
+# and most scripts, like gg.py, never use them
 
 
 """
@@ -30,6 +33,17 @@ DEFAULT_LOG_MSG_FORMAT = (
     "%(asctime)s:%(filename)s:%(funcName)s-%(levelname)s %(message)s"
 )
 DEFAULT_LOG_DATE_FORMAT = "%d-%m-%YT%H:%M:%S"
+DEFAULT_CACHE_DIR = "cache"
+J2_BYTECODE_CACHE_SUBDIR = "j2"
+# next to the scripts, not in the current directory which can be read-only
+DEFAULT_J2_BYTECODE_CACHE_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), DEFAULT_CACHE_DIR, J2_BYTECODE_CACHE_SUBDIR
+)
+J2_TEMPLATE_CACHE_SIZE = 400
+DEFAULT_POLL_INITIAL_INTERVAL = 0.5
+DEFAULT_POLL_MAX_INTERVAL = 10
+DEFAULT_POLL_BACKOFF_FACTOR = 2
+DEFAULT_POLL_JITTER = 0.2
 
 """
 """
@@ -78,6 +92,124 @@ def read_file(fn, mode):
     return data
 
 
+"""
+maps func over items, on a thread pool when workers is greater than 1
+the results are returned in the order of items
+"""
+
+
+def ordered_map(func, items, workers=1):
+    if workers <= 1:
+        return list(map(func, items))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(func, items))
+
+
+"""
+like ordered_map, but yields the results as a stream
+at most max_pending items are processed ahead of the consumer, so the memory stays flat
+"""
+
+
+def ordered_imap(func, items, workers=1, max_pending=None):
+    if workers <= 1:
+        yield from map(func, items)
+        return
+    if not max_pending:
+        max_pending = workers * 4
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for item in items:
+            pending.append(executor.submit(func, item))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+"""
+runs the tasks (key -> function without arguments) of a dependency graph (key -> keys of the tasks to wait for)
+a task starts as soon as all its dependencies are done, ready tasks start in the order of the tasks dict
+on_done is called in the calling thread with the key and the result of every finished task
+returns a dict key -> result, the first exception of a task stops the graph and is raised
+"""
+
+
+def run_dependency_graph(tasks, dependencies=None, workers=1, on_done=None):
+    dependencies = dependencies or {}
+    workers = max(workers, 1)
+    order = {key: i for i, key in enumerate(tasks)}
+    waiting = {}
+    dependents = {}
+    for key in tasks:
+        waiting[key] = set(dependencies.get(key, []))
+        for dependency in waiting[key]:
+            if dependency not in tasks:
+                raise Exception(
+                    f"task: {key} depends on the unknown task: {dependency}"
+                )
+            dependents.setdefault(dependency, []).append(key)
+    # raises graphlib.CycleError
+    graphlib.TopologicalSorter(waiting).prepare()
+    ready = [order[key] for key in tasks if not waiting[key]]
+    heapq.heapify(ready)
+    keys = list(tasks)
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        running = {}
+        while ready or running:
+            while ready and len(running) < workers:
+                key = keys[heapq.heappop(ready)]
+                running[executor.submit(tasks[key])] = key
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in [future for future in running if future in done]:
+                key = running.pop(future)
+                results[key] = future.result()
+                if on_done:
+                    on_done(key, results[key])
+                for dependent in dependents.get(key, []):
+                    waiting[dependent].discard(key)
+                    if not waiting[dependent]:
+                        heapq.heappush(ready, order[dependent])
+    return results
+
+
+"""
+calls func until is_done returns True for its result and returns the last result
+the first polls are fast, the interval grows exponentially up to max_interval and is randomized by +/- jitter
+raises TimeoutError if the condition is not met within timeout seconds
+on_wait is called with the last result and the delay before every wait
+"""
+
+
+def poll_until(
+    func,
+    is_done,
+    timeout,
+    initial_interval=DEFAULT_POLL_INITIAL_INTERVAL,
+    max_interval=DEFAULT_POLL_MAX_INTERVAL,
+    factor=DEFAULT_POLL_BACKOFF_FACTOR,
+    jitter=DEFAULT_POLL_JITTER,
+    on_wait=None,
+):
+    deadline = time.monotonic() + timeout
+    interval = initial_interval
+    while True:
+        result = func()
+        if is_done(result):
+            return result
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(
+                f"condition not met after {timeout} seconds, last result: {result}"
+            )
+        delay = min(interval * random.uniform(1 - jitter, 1 + jitter), remaining)
+        if on_wait:
+            on_wait(result, delay)
+        time.sleep(delay)
+        interval = min(interval * factor, max_interval)
+
+
 """
 reads a json file and returns a dict
 """
@@ -97,14 +229,56 @@ def write_json(data_dict, fn):
 
 
 
+# directory of the bytecode of the compiled templates, see init_j2_bytecode_cache_dir
+j2_bytecode_cache_dir = DEFAULT_J2_BYTECODE_CACHE_DIR
+
+
 """
-reads a jinja2 file and returns a template
+sets the directory of the bytecode of the templates to <metadata_cache_dir>/j2 if the config defines metadata_cache_dir
+"""
+
+
+def init_j2_bytecode_cache_dir(config):
+    global j2_bytecode_cache_dir
+    if config.get("metadata_cache_dir"):
+        j2_bytecode_cache_dir = os.path.join(
+            config["metadata_cache_dir"], J2_BYTECODE_CACHE_SUBDIR
+        )
+
+
+"""
+returns the jinja2 environment shared by all templates of the process
+the compiled templates are kept in memory and their bytecode on disk for the next runs
+if the bytecode directory can not be created, the templates are compiled in every run
+"""
+
+
+@functools.lru_cache(maxsize=None)
+def get_j2_environment(bytecode_cache_dir=DEFAULT_J2_BYTECODE_CACHE_DIR):
+    import jinja2
+
+    bytecode_cache = None
+    try:
+        Path(bytecode_cache_dir).mkdir(parents=True, exist_ok=True)
+        bytecode_cache = jinja2.FileSystemBytecodeCache(bytecode_cache_dir)
+    except OSError as e:
+        logging.getLogger(__name__).debug(f"no bytecode cache for the templates: {e}")
+    return jinja2.Environment(
+        loader=jinja2.FileSystemLoader(os.path.sep),
+        bytecode_cache=bytecode_cache,
+        cache_size=J2_TEMPLATE_CACHE_SIZE,
+    )
+
+
+"""
+reads a jinja2 file and returns a template, every template is compiled only once
 """
 
 
 def read_j2_template(fn):
-    with open(fn) as fh:
-        return jinja2.Template(fh.read())
+    return get_j2_environment(j2_bytecode_cache_dir).get_template(
+        os.path.abspath(fn)
+    )
 
 
 """
@@ -116,6 +290,31 @@ def write_text_to_file(out_fn, text):
         fh.write(text)
 
 
+"""
+replaces out_fn with tmp_fn if the content is different, otherwise tmp_fn is removed
+returns True if out_fn was replaced
+"""
+
+
+def replace_file_if_changed(tmp_fn, out_fn):
+    if os.path.exists(out_fn) and filecmp.cmp(tmp_fn, out_fn, shallow=False):
+        os.remove(tmp_fn)
+        return False
+    os.replace(tmp_fn, out_fn)
+    return True
+
+
+"""
+writes the text into the file only if the content is different, returns True if the file was written
+"""
+
+
+def write_text_to_file_if_changed(out_fn, text):
+    tmp_fn = out_fn + ".tmp"
+    write_text_to_file(tmp_fn, text)
+    return replace_file_if_changed(tmp_fn, out_fn)
+
+
 """
 writes into a file the result of rendering the jinja2  with data
 """
@@ -177,6 +376,14 @@ def send_mail(
     is_html=False,
     attachment_fn=None,
 ):
+    from email import encoders
+    from email.mime.base import MIMEBase
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+
+    import mimetypes
+    import smtplib
+
     outer = MIMEMultipart("alternative")
     outer["From"] = from_addr
     outer["To"] = ", ".join(to_addrs_list)
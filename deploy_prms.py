@@ -6,12 +6,13 @@ Script to automate the deplyoment of gg files
 
 from getpass import getpass
 import argparse
+import functools
 import string
-import time
 
 import common
 import gen_prms
 import gg
+import lazydb
 
 from constants import VALID_ENVS
 
@@ -19,6 +20,21 @@ from constants import VALID_ENVS
 """
 Constants
 """
+COMMAND_MAPPING = {
+    "extract": {
+        "list_command": "list_extracts",
+        "issue_command": "extract_issue_command",
+        "retrieve_status_command": "extract_retrieve_status",
+    },
+    "replicat": {
+        "list_command": "list_replicats",
+        "issue_command": "replicat_issue_command",
+        "retrieve_status_command": "replicat_retrieve_status",
+    },
+}
+STOPPED_STATUSES = ["stopped", "abended"]
+DEFAULT_STOP_TIMEOUT = gg.DEFAULT_WAIT_TIMEOUT
+DEFAULT_DEPLOY_WORKERS = 4
 
 
 """
@@ -26,36 +42,65 @@ Constants
 
 
 class PrmDeployer:
-    def __init__(self, config, env, ggadmin_password, verbose=False):
+    def __init__(
+        self,
+        config,
+        env,
+        ggadmin_password,
+        verbose=False,
+        gg_client=None,
+        source_db_conn=None,
+    ):
         self.config = config
         self.env = env
         self.ggadmin_password = ggadmin_password
         self.verbose = verbose
+        # all the calls of the deployment share the session of the client
+        if gg_client:
+            self.gg_client = gg_client
+        else:
+            self.gg_client = gg.GgClient(
+                config, env, password=ggadmin_password, verbose=verbose
+            )
+        # every generation reuses the source db connection, it is opened by the first query
+        self.source_db_conn = source_db_conn
 
     """
     generate all the needed prm files for the environment env
     """
 
-    def generate_prms(self):
+    def generate_prms(self, incremental=False):
         if self.verbose:
             print("generating prms")
-        gen_prms.gen_prms(self.config, self.env)
+        if not self.source_db_conn:
+            self.source_db_conn = lazydb.LazyDb(
+                self.config[self.env]["source_db"], lazy=True
+            )
+        changed_files = gen_prms.gen_prms(
+            self.config,
+            self.env,
+            incremental=incremental,
+            source_db_conn=self.source_db_conn,
+        )
+        if self.verbose:
+            print(f"changed files: {', '.join(changed_files) or 'none'}")
+        return changed_files
 
     """
     return True if the process exists, False otherwise
     """
 
-    def process_exists(self, process_type, issue_cmd):
-        process_name = self.config[self.env]["processes"][process_type]["process_name"]
+    def process_exists(self, process_key, issue_cmd):
+        process_name = self.config[self.env]["processes"][process_key]["process_name"]
         if self.verbose:
             print(
-                f"Checking process_type: {process_type} process_name: {process_name} command: {issue_cmd}"
+                f"Checking process: {process_key} process_name: {process_name} command: {issue_cmd}"
             )
         resp = gg.do_work(
             config=self.config,
             env=self.env,
             command=issue_cmd,
-            password=self.ggadmin_password,
+            client=self.gg_client,
             verbose=self.verbose,
         ).json()
         if resp:
@@ -74,18 +119,20 @@ class PrmDeployer:
 
     """
     stops the given process and waits until the process status is stopped
+    raises TimeoutError if the process is not stopped within timeout seconds
     """
 
     def stop_process(
         self,
-        process_type,
+        process_key,
         issue_cmd,
         force,
         retrieve_status_cmd,
+        timeout=DEFAULT_STOP_TIMEOUT,
     ):
-        process_name = self.config[self.env]["processes"][process_type]["process_name"]
+        process_name = self.config[self.env]["processes"][process_key]["process_name"]
         if self.verbose:
-            print(f"Stopping {process_type} {process_name}")
+            print(f"Stopping {process_key} {process_name}")
         if force:
             stop_args_json = '{"command": "FORCESTOP"}'
         else:
@@ -96,26 +143,13 @@ class PrmDeployer:
             command=issue_cmd,
             command_arg=process_name,
             command_args_json=stop_args_json,
-            password=self.ggadmin_password,
+            client=self.gg_client,
             verbose=self.verbose,
         )
 
-        stopped = False
-        while not stopped:
-            resp = gg.do_work(
-                config=self.config,
-                env=self.env,
-                command=retrieve_status_cmd,
-                command_arg=process_name,
-                password=self.ggadmin_password,
-                verbose=self.verbose,
-            ).json()
-            if resp["response"]["status"] in ("stopped", "abended"):
-                stopped = True
-            else:
-                if self.verbose:
-                    print(f"Status returned: {resp['response']['status']}, waiting...")
-                time.sleep(10)
+        self.gg_client.wait_for_status(
+            retrieve_status_cmd, process_name, STOPPED_STATUSES, timeout
+        )
         if self.verbose:
             print(f"{process_name} stopped")
 
@@ -123,8 +157,10 @@ class PrmDeployer:
     strts the process given by process_name
     """
 
-    def start_process(self, process_type):
-        process_name = self.config[self.env]["processes"][process_type]["process_name"]
+    def start_process(self, process_key):
+        process_config = self.config[self.env]["processes"][process_key]
+        process_name = process_config["process_name"]
+        process_type = gen_prms.get_process_type(process_key, process_config)
         if self.verbose:
             print(f"Starting process {process_name}")
         cmd_template = string.Template(
@@ -138,7 +174,7 @@ class PrmDeployer:
             env=self.env,
             command="execute_command",
             command_args_json=cmd_json,
-            password=self.ggadmin_password,
+            client=self.gg_client,
             verbose=self.verbose,
         )
         if self.verbose:
@@ -152,7 +188,7 @@ class PrmDeployer:
             config=self.config,
             env=self.env,
             command="list_config_files",
-            password=self.ggadmin_password,
+            client=self.gg_client,
             verbose=self.verbose,
         ).json()
         config_files = []
@@ -172,23 +208,70 @@ class PrmDeployer:
             command=command,
             command_arg=file_name,
             command_arg_fn=file_name,
-            password=self.ggadmin_password,
+            client=self.gg_client,
             verbose=self.verbose,
         )
         if self.verbose:
             print(f"{file_name} deployed")
 
     """
-    deploys the given file with the  associated command
+    returns True if the file on the server has the same lines as the local file
     """
 
-    def deploy_config_files(self, files):
+    def is_config_file_unchanged(self, file_name):
+        resp = gg.do_work(
+            config=self.config,
+            env=self.env,
+            command="retrieve_configuration_file",
+            command_arg=file_name,
+            client=self.gg_client,
+            verbose=self.verbose,
+            exit_on_http_err=False,
+        )
+        if resp.status_code not in gg.REST_OK_STATUS_CODE:
+            return False
+        with open(file_name) as fh:
+            lines = fh.read().splitlines()
+        return resp.json()["response"].get("lines") == lines
+
+    """
+    returns the command to upload the file, None if the file does not need to be uploaded
+    with the report of the generation (changed_files), the unchanged files are not uploaded again
+    with differential, the files identical on the server are not uploaded
+    """
+
+    def plan_upload(
+        self, file_name, available_config_files, changed_files=None, differential=False
+    ):
+        if file_name not in available_config_files:
+            return "create_configuration_file"
+        if changed_files is not None and file_name not in changed_files:
+            if self.verbose:
+                print(f"Skipping unchanged file {file_name}")
+            return None
+        if differential and self.is_config_file_unchanged(file_name):
+            if self.verbose:
+                print(f"Skipping file {file_name}, identical on the server")
+            return None
+        return "replace_configuration_file"
+
+    """
+    deploys the given files with the associated command, see plan_upload for the skipped files
+    """
+
+    def deploy_config_files(
+        self, files, changed_files=None, differential=False, workers=1
+    ):
         available_config_files = self.get_config_files()
-        for file_name in files:
-            if file_name in available_config_files:
-                self.upload_config_file(file_name, "replace_configuration_file")
-            else:
-                self.upload_config_file(file_name, "create_configuration_file")
+
+        def deploy_config_file(file_name):
+            command = self.plan_upload(
+                file_name, available_config_files, changed_files, differential
+            )
+            if command:
+                self.upload_config_file(file_name, command)
+
+        common.ordered_map(deploy_config_file, files, workers)
 
 
 """
@@ -201,12 +284,128 @@ def get_process_files(process_config):
     if isinstance(process_config["prm_table_file_name"], str):
         file_names = [process_config["prm_table_file_name"]]
     else:
-        file_names = process_config["prm_table_file_name"]
+        file_names = list(process_config["prm_table_file_name"])
     # now add just the process prm file
     file_names.append(process_config["prm_file_name"])
     return file_names
 
 
+"""
+stops the processes, uploads their files and starts them again, the steps are the tasks of a dependency graph
+the independent steps run concurrently: the existence checks, the stops of the processes and the uploads of the files
+a file is uploaded after its process is stopped and a process is started after all its files are uploaded
+with workers=1 the steps run in the order: checks, stops, uploads, starts, the extracts before the replicats
+the upload of every file is planned before the processes are stopped
+a process whose files are all skipped is neither stopped nor started, unless always_restart is set
+"""
+
+
+def deploy_processes(
+    prm_deployer,
+    processes,
+    force,
+    stop_timeout=DEFAULT_STOP_TIMEOUT,
+    changed_files=None,
+    workers=1,
+    differential=False,
+    always_restart=False,
+):
+    # the extracts are stopped and started before the replicats
+    process_types = dict(
+        sorted(
+            (
+                (
+                    process_key,
+                    gen_prms.get_process_type(process_key, process_config),
+                )
+                for process_key, process_config in processes.items()
+            ),
+            key=lambda item: gen_prms.PROCESS_TYPES.index(item[1]),
+        )
+    )
+    process_files = {
+        process_key: get_process_files(processes[process_key])
+        for process_key in process_types
+    }
+    # results of the finished tasks, filled before their dependent tasks start
+    results = {}
+
+    def plan_upload(file_name):
+        return prm_deployer.plan_upload(
+            file_name, results["list_config_files"], changed_files, differential
+        )
+
+    def needs_restart(process_key):
+        if not results[f"exists:{process_key}"]:
+            return False
+        uploaded_files = [
+            file_name
+            for file_name in process_files[process_key]
+            if results[f"plan:{file_name}"]
+        ]
+        if always_restart or uploaded_files:
+            print(
+                f"process: {processes[process_key]['process_name']} restarted, uploaded files: {uploaded_files}"
+            )
+            return True
+        print(
+            f"process: {processes[process_key]['process_name']} not restarted, all files are unchanged"
+        )
+        return False
+
+    def stop_process(process_key, process_type):
+        if needs_restart(process_key):
+            prm_deployer.stop_process(
+                process_key,
+                COMMAND_MAPPING[process_type]["issue_command"],
+                force,
+                COMMAND_MAPPING[process_type]["retrieve_status_command"],
+                stop_timeout,
+            )
+            return True
+        return False
+
+    def upload_file(file_name):
+        command = results[f"plan:{file_name}"]
+        if command:
+            prm_deployer.upload_config_file(file_name, command)
+
+    def start_process(process_key):
+        if results[f"stop:{process_key}"]:
+            prm_deployer.start_process(process_key)
+
+    tasks = {"list_config_files": prm_deployer.get_config_files}
+    dependencies = {}
+    for process_key, process_type in process_types.items():
+        tasks[f"exists:{process_key}"] = functools.partial(
+            prm_deployer.process_exists,
+            process_key,
+            COMMAND_MAPPING[process_type]["list_command"],
+        )
+    # the files are compared with the server before the processes are stopped
+    for process_key in process_types:
+        for file_name in process_files[process_key]:
+            tasks[f"plan:{file_name}"] = functools.partial(plan_upload, file_name)
+            dependencies[f"plan:{file_name}"] = ["list_config_files"]
+    for process_key, process_type in process_types.items():
+        tasks[f"stop:{process_key}"] = functools.partial(
+            stop_process, process_key, process_type
+        )
+        dependencies[f"stop:{process_key}"] = [f"exists:{process_key}"] + [
+            f"plan:{file_name}" for file_name in process_files[process_key]
+        ]
+    for process_key in process_types:
+        dependencies[f"start:{process_key}"] = [f"stop:{process_key}"]
+        for file_name in process_files[process_key]:
+            if f"upload:{file_name}" not in tasks:
+                tasks[f"upload:{file_name}"] = functools.partial(upload_file, file_name)
+                dependencies[f"upload:{file_name}"] = [f"stop:{process_key}"]
+            dependencies[f"start:{process_key}"].append(f"upload:{file_name}")
+    for process_key in process_types:
+        tasks[f"start:{process_key}"] = functools.partial(start_process, process_key)
+    common.run_dependency_graph(tasks, dependencies, workers, results.__setitem__)
+
+
 """
 do_work
 """
@@ -218,32 +417,29 @@ def do_work(args):
     if not ggadmin_password:
         ggadmin_password = getpass("Enter GGADMIN Password:")
     #
-    prm_deployer = PrmDeployer(config, args.env, ggadmin_password, args.verbose)
-    prm_deployer.generate_prms()
-    extract_exists = prm_deployer.process_exists("extract", "list_extracts")
-    replicat_exists = prm_deployer.process_exists("replicat", "list_replicats")
-    #
-    if extract_exists:
-        prm_deployer.stop_process(
-            "extract",
-            "extract_issue_command",
-            args.force,
-            "extract_retrieve_status",
+    with gg.GgClient(
+        config,
+        args.env,
+        password=ggadmin_password,
+        verbose=args.verbose,
+        pool_maxsize=max(args.workers, gg.DEFAULT_HTTP_POOL_MAXSIZE),
+    ) as gg_client, lazydb.LazyDb(
+        config[args.env]["source_db"], lazy=True
+    ) as source_db_conn:
+        prm_deployer = PrmDeployer(
+            config, args.env, ggadmin_password, args.verbose, gg_client, source_db_conn
         )
-    if replicat_exists:
-        prm_deployer.stop_process(
-            "replicat",
-            "replicat_issue_command",
+        changed_files = prm_deployer.generate_prms(args.incremental)
+        deploy_processes(
+            prm_deployer,
+            config[args.env]["processes"],
             args.force,
-            "replicat_retrieve_status",
+            args.stop_timeout,
+            changed_files if args.only_changed else None,
+            args.workers,
+            args.differential,
+            args.always_restart,
         )
-    source_files = get_process_files(config[args.env]["processes"]["extract"])
-    target_files = get_process_files(config[args.env]["processes"]["replicat"])
-    prm_deployer.deploy_config_files(source_files + target_files)
-    if extract_exists:
-        prm_deployer.start_process("extract")
-    if replicat_exists:
-        prm_deployer.start_process("replicat")
 
 
 """
@@ -260,11 +456,14 @@ Generates and deploys all prm files associated to the given environment
         epilog="""
 This script performs the following tasks:
 
-1. the extract process is stopped
-2. the replicat process stopped
+1. the extract processes are stopped
+2. the replicat processes are stopped
 3. all associated prm files are uploaded using the given command
-4. the extract process is started
-5. the replicat process is started
+4. the extract processes are started
+5. the replicat processes are started
+
+With --workers greater than 1 the independent steps run concurrently: the processes are stopped at the same time,
+the files of a process are uploaded as soon as it is stopped and a process is started as soon as its files are uploaded.
 
 Example: create all prm files for the prod environment and uploads them
 
@@ -277,6 +476,38 @@ Example: create all prm files for the prod environment and uploads them
         "-f", "--force", action="store_true", help="stop the processes with force"
     )
     parser.add_argument("-p", "--password", help="GGADMIN password")
+    parser.add_argument(
+        "--stop_timeout",
+        type=float,
+        default=DEFAULT_STOP_TIMEOUT,
+        help="seconds to wait for a process to stop",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_DEPLOY_WORKERS,
+        help="number of deployment steps running at the same time, 1 runs them one after the other",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="skips the tables prms of the processes whose inputs did not change since the last run",
+    )
+    parser.add_argument(
+        "--differential",
+        action="store_true",
+        help="compares the files with the server and uploads only the different ones",
+    )
+    parser.add_argument(
+        "--always_restart",
+        action="store_true",
+        help="restarts the processes even if none of their files changed",
+    )
+    parser.add_argument(
+        "--only_changed",
+        action="store_true",
+        help="uploads only the files changed by the generation, assumes the last deployment succeeded",
+    )
     parser.add_argument(
         "-v", "--verbose", action="store_true", help="increase output verbosity"
     )
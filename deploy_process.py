@@ -9,7 +9,6 @@ from string import Template
 from common
 
 import argparse
-import time
 
 import gen_prms
 import gg
@@ -31,11 +30,16 @@ COMMAND_MAPPING = {
 
 
 class ProcessDeployer:
-    def __init__(self, config, env, process_type, password):
+    def __init__(self, config, env, process_type, password, gg_client=None):
         self.config = config
         self.env = env
         self.process_type = process_type
         self.password = password
+        # all the calls of the deployer share the session of the client
+        if gg_client:
+            self.gg_client = gg_client
+        else:
+            self.gg_client = gg.GgClient(config, env, password=password)
         #
         self.process_config = config[env][process_type]
         self.process_name = self.process_config["process_name"]
@@ -44,7 +48,7 @@ class ProcessDeployer:
         self.issue_command = self.commands["issue_command"]
         self.retrieve_status_command = self.commands["retrieve_status_command"]
 
-    def stop(self, force):
+    def stop(self, force, timeout=gg.DEFAULT_WAIT_TIMEOUT):
         if force:
             stop_args_json = '{"command": "FORCESTOP"}'
         else:
@@ -56,22 +60,11 @@ class ProcessDeployer:
             self.issue_command,
             self.process_name,
             command_args_json=stop_args_json,
-            password=self.password,
+            client=self.gg_client,
+        )
+        self.gg_client.wait_for_status(
+            self.retrieve_status_command, self.process_name, ["stopped"], timeout
         )
-        stopped = False
-        while not stopped:
-            r = gg.do_work(
-                self.config,
-                self.env,
-                self.retrieve_status_command,
-                command_arg=self.process_name,
-                password=self.password,
-            ).json()
-            if r["status"] == "stopped":
-                stopped = True
-            else:
-                print(f"Status returned: {r['status']}, waiting...")
-                time.sleep(10)
         print("done")
 
     def start(self):
@@ -88,7 +81,7 @@ class ProcessDeployer:
             "execute_command",
             command_arg=self.process_name,
             command_args_json=cmd_json,
-            password=self.password,
+            client=self.gg_client,
         )
         print("done")
 
@@ -98,7 +91,7 @@ class ProcessDeployer:
             self.env,
             self.issue_cmd,
             self.process_name,
-            password=self.password,
+            client=self.gg_client,
         ).json()
         for item in r["items"]:
             if item["name"] == self.process_name:
@@ -5,11 +5,13 @@ Script to generate sql for the LandingZone
 """
 
 import argparse
+import hashlib
 import sys
 
 import lazydb
+import metadata
 
-from common import common
+import common
 from tables import tables
 from lobs import lobs
 from constants import VALID_ENVS
@@ -19,17 +21,20 @@ from constants import VALID_ENVS
 Constants
 """
 FILTER_STEPS = ["create_tables", "tables_add_ons", "drop_lobs"]
+GEN_CREATE_TABLE_SQL_FN = "sql/gen_create_table.sql"
 
 """
 """
 
 
 class LdzGenerator:
-    def __init__(self, db_conn, tables_fn, lobs_fn, verbose):
+    def __init__(self, db_conn, tables_fn, lobs_fn, verbose, metadata_cache=None):
         self.db_conn = db_conn
         self.tables_obj = tables.Tables(tables_fn)
         self.lobs_obj = lobs.Lobs(lobs_fn)
         self.verbose = verbose
+        self.metadata_cache = metadata_cache
+        self.table_columns = metadata.TableColumns(db_conn, verbose, metadata_cache)
 
     """
     """
@@ -39,13 +44,39 @@ class LdzGenerator:
         self.lobs_obj.load_lobs_into_db(self.db_conn)
 
     """
+    returns the tables matching filter_table, all tables if no filter is given
+    """
+
+    def filter_tables(self, filter_table):
+        return [
+            table
+            for table in self.tables_obj.tables
+            if not filter_table or filter_table == table.table_name
+        ]
+
+    """
+    the create table ddls are taken from the metadata cache for the tables without ddl changes
     """
 
     def gen_tables(self, filter_table):
-        for table in self.tables_obj.tables:
-            if not filter_table or filter_table == table.table_name:
+        selected_tables = self.filter_tables(filter_table)
+        cached_ddls = {}
+        if self.metadata_cache:
+            # the cached ddls are only valid for the current version of the sql
+            sql_hash = hashlib.sha1(
+                lazydb.SQL_REGISTRY.get_sql_file(GEN_CREATE_TABLE_SQL_FN).encode()
+            ).hexdigest()
+            cache_kind = f"create_table:{sql_hash}"
+            cached_ddls, _ = self.metadata_cache.get_valid(
+                cache_kind,
+                [(table.owner, table.table_name) for table in selected_tables],
+            )
+        new_ddls = {}
+        for table in selected_tables:
+            ddl = cached_ddls.get((table.owner, table.table_name))
+            if ddl is None:
                 row = self.db_conn.execute_sql(
-                    sql_fn="sql/gen_create_table.sql",
+                    sql_fn=GEN_CREATE_TABLE_SQL_FN,
                     fetch_only_one=True,
                     bind_data={"owner": table.owner, "table_name": table.table_name},
                 )
@@ -55,39 +86,39 @@ class LdzGenerator:
                     )
                     sys.exit(1)
                 (ddl,) = row
-                sys.stdout.write(ddl + ";\n")
+                new_ddls[(table.owner, table.table_name)] = ddl
+            sys.stdout.write(ddl + ";\n")
+        if self.metadata_cache and new_ddls:
+            self.metadata_cache.put(cache_kind, new_ddls)
 
     """
     """
 
     def gen_tables_addons(self, filter_table):
         j2_gen_table_addons = common.read_j2_template("sql/gen_table_addons.sql.j2")
-        for table in self.tables_obj.tables:
-            if not filter_table or filter_table == table.table_name:
-                sys.stdout.write("\n")
-                sys.stdout.write(
-                    j2_gen_table_addons.render({"table_name": table.table_name})
-                )
+        for table in self.filter_tables(filter_table):
+            sys.stdout.write("\n")
+            sys.stdout.write(
+                j2_gen_table_addons.render({"table_name": table.table_name})
+            )
 
     """
     generate DROP COLUMN for all lob columns (data_type IN ('CLOB', 'BLOB') not included in the file lobs.csv
     """
 
     def gen_drop_lobs(self, filter_table):
-        for table in self.tables_obj.tables:
-            if not filter_table or filter_table == table.table_name:
-                rows = self.db_conn.execute_sql(
-                    sql_fn="sql/get_lob_columns.sql",
-                    bind_data={"owner": table.owner, "table_name": table.table_name},
-                )
-                for (column_name,) in rows:
-                    if not self.lobs_obj.is_member(
-                        table.owner, table.table_name, column_name
-                    ):
-                        sys.stdout.write("\n")
-                        sys.stdout.write(
-                            f"ALTER TABLE {table.table_name} DROP COLUMN {column_name};"
-                        )
+        selected_tables = self.filter_tables(filter_table)
+        # the columns of all tables are fetched at once instead of one query per table
+        self.table_columns.load(selected_tables)
+        for table in selected_tables:
+            for column_name, data_type, _ in self.table_columns.get(table):
+                if data_type in lazydb.LOB_DATATYPES and not self.lobs_obj.is_member(
+                    table.owner, table.table_name, column_name
+                ):
+                    sys.stdout.write("\n")
+                    sys.stdout.write(
+                        f"ALTER TABLE {table.table_name} DROP COLUMN {column_name};"
+                    )
 
 
 """
@@ -100,20 +131,27 @@ def do_work(
     tables_fn,
     lobs_fn,
     args,
+    metadata_cache_dir=metadata.DEFAULT_METADATA_CACHE_DIR,
 ):
     # create a copy for lazydb (owner is not needed for the connection)
     if "owner" in db_config:
         db_config_copy = dict(db_config)
         del db_config_copy["owner"]
-        db_conn = lazydb.LazyDb(db_config_copy)
+        db_conn = lazydb.LazyDb(db_config_copy, lazy=True)
     else:
-        db_conn = lazydb.LazyDb(db_config)
+        db_conn = lazydb.LazyDb(db_config, lazy=True)
+    metadata_cache = None
+    if not args.no_metadata_cache:
+        metadata_cache = metadata.MetadataCache(
+            db_conn, db_config["dsn"], metadata_cache_dir, args.verbose
+        )
     #
     ldz_generator = LdzGenerator(
         db_conn,
         tables_fn,
         lobs_fn,
         args.verbose,
+        metadata_cache,
     )
     if not args.filter_step or args.filter_step == "create_tables":
         ldz_generator.gen_tables(args.filter_table)
@@ -121,6 +159,8 @@ def do_work(
         ldz_generator.gen_tables_addons(args.filter_table)
     if not args.filter_step or args.filter_step == "drop_lobs":
         ldz_generator.gen_drop_lobs(args.filter_table)
+    if metadata_cache:
+        metadata_cache.close()
 
 
 """
@@ -166,6 +206,11 @@ Example 2: generates the SQLs for the LandingZone on prod
         "--filter_table", help="only the SQLs for the given table will be generated"
     )
     parser.add_argument("--pwd_db", help="Password for source db")
+    parser.add_argument(
+        "--no_metadata_cache",
+        action="store_true",
+        help="ignore the local metadata cache and query all tables from the db",
+    )
     return parser
 
 
@@ -179,7 +224,9 @@ def main():
     args = parser.parse_args()
     config_file = args.config_file
     env = args.env
-    config = common.read_json(config_file)[env]
+    all_config = common.read_json(config_file)
+    common.init_j2_bytecode_cache_dir(all_config)
+    config = all_config[env]
     #
     if args.verbose:
         print(f"Filter table {args.filter_table}")
@@ -194,6 +241,7 @@ def main():
         config["tables_file"],
         config["lobs_file"],
         args,
+        all_config.get("metadata_cache_dir", metadata.DEFAULT_METADATA_CACHE_DIR),
     )
 
 
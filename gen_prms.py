@@ -7,14 +7,23 @@ Script to generate the files for
 from pprint import pprint as pp
 
 import argparse
+import heapq
+import os
 
 import common
 import lazydb
+import manifest
+import metadata
 from tables import tables
 from lobs import lobs
 
 from constants import VALID_ENVS
 
+"""
+Constants
+"""
+PROCESS_TYPES = ["extract", "replicat"]
+
 """
 """
 
@@ -31,6 +40,130 @@ class ExcessiveFilesWarning(Warning):
     pass
 
 
+"""
+returns the process type of the process, by default the key of the process is the process type
+"""
+
+
+def get_process_type(process_key: str, process_config: dict[str, any]) -> str:
+    process_type = process_config.get("process_type", process_key)
+    if process_type not in PROCESS_TYPES:
+        raise Exception(f"process: {process_key} has an unknown type: {process_type}")
+    return process_type
+
+
+"""
+distributes the tables into number_of_groups groups with a similar total weight
+greedy: the heaviest table goes to the lightest group, the tables of each group keep their original order
+"""
+
+
+def balance_tables(
+    tables_list: list, weights: dict[tuple[str, str], int], number_of_groups: int
+) -> list[list]:
+    # (total weight, number of tables, group index) of each group
+    groups = [(0, 0, group_index) for group_index in range(number_of_groups)]
+    heapq.heapify(groups)
+    group_indexes = [[] for _ in range(number_of_groups)]
+    table_weights = [weights[(table.owner, table.table_name)] for table in tables_list]
+    for table_index in sorted(
+        range(len(tables_list)), key=lambda table_index: -table_weights[table_index]
+    ):
+        total_weight, number_of_tables, group_index = heapq.heappop(groups)
+        group_indexes[group_index].append(table_index)
+        heapq.heappush(
+            groups,
+            (
+                total_weight + table_weights[table_index],
+                number_of_tables + 1,
+                group_index,
+            ),
+        )
+    return [
+        [tables_list[table_index] for table_index in sorted(table_indexes)]
+        for table_indexes in group_indexes
+    ]
+
+
+"""
+inputs shared by the generators of all processes of an environment, they are read only once
+"""
+
+
+class PrmInputs:
+    def __init__(
+        self,
+        config: dict[str, any],
+        source_db_conn: lazydb.LazyDb,
+        verbose: bool = False,
+        metadata_cache: metadata.MetadataCache = None,
+        workers: int = 1,
+    ):
+        self.source_db_conn = source_db_conn
+        self.verbose = verbose
+        self.workers = workers
+        self.processes = config["processes"]
+        self.table_weight = config.get("table_distribution", {}).get(
+            "weight", "table_count"
+        )
+        self.tables = tables.Tables(config["tables_file"])
+        self.lobs = lobs.Lobs(config["lobs_file"])
+        self.table_columns = metadata.TableColumns(
+            source_db_conn, verbose, metadata_cache, workers
+        )
+        self.j2_templates = {}
+        # table_group -> tables of the processes of the group
+        self.table_groups = {}
+
+    """
+    returns the template, every template is read only once
+    """
+
+    def get_j2_template(self, template_name: str):
+        if template_name not in self.j2_templates:
+            self.j2_templates[template_name] = common.read_j2_template(template_name)
+        return self.j2_templates[template_name]
+
+    """
+    distributes the tables across the table groups of the processes, balanced by the table weight
+    """
+
+    def distribute_tables(self):
+        table_groups = list(
+            dict.fromkeys(
+                process_config["table_group"]
+                for process_config in self.processes.values()
+                if "table_group" in process_config
+            )
+        )
+        weights = metadata.TableWeights(
+            self.source_db_conn, self.table_weight, self.verbose, self.workers
+        ).load(self.tables.tables)
+        for table_group, group_tables in zip(
+            table_groups,
+            balance_tables(self.tables.tables, weights, len(table_groups)),
+        ):
+            self.table_groups[table_group] = group_tables
+            if self.verbose:
+                group_weight = sum(
+                    weights[(table.owner, table.table_name)] for table in group_tables
+                )
+                print(
+                    f"table_group: {table_group} tables: {len(group_tables)} {self.table_weight}: {group_weight}"
+                )
+
+    """
+    returns the tables of the process, all tables if the process has no table_group
+    """
+
+    def get_process_tables(self, process_config: dict[str, any]) -> list:
+        if "table_group" not in process_config:
+            return self.tables.tables
+        if not self.table_groups:
+            self.distribute_tables()
+        return self.table_groups[process_config["table_group"]]
+
+
 """
 """
 
@@ -40,57 +173,63 @@ class PrmGenerator:
 
     def __init__(
         self,
-        process_type: str,
+        process_key: str,
         config: dict[str, any],
         source_db_conn: lazydb.LazyDb,
         verbose: bool = False,
+        metadata_cache: metadata.MetadataCache = None,
+        workers: int = 1,
+        prm_inputs: PrmInputs = None,
+        prm_manifest: manifest.PrmManifest = None,
     ):
-        self.process_type = process_type
+        self.process_key = process_key
         self.verbose = verbose
+        self.workers = workers
+        self.prm_manifest = prm_manifest
+        # files whose content changed in this run
+        self.changed_files = []
         #
         self.source_db_config = config["source_db"]
         self.target_db_config = config["target_db"]
-        self.process_config = config["processes"][process_type]
+        self.process_config = config["processes"][process_key]
+        self.process_type = get_process_type(process_key, self.process_config)
         self.genfetchcols = True
-        if "opts" in config["processes"][process_type]:
-            if "nofetchcols" in config["processes"][process_type]["opts"]:
+        if "opts" in self.process_config:
+            if "nofetchcols" in self.process_config["opts"]:
                 self.genfetchcols = False
         #
         if source_db_conn:
             self.source_db_conn = source_db_conn
         else:
-            self.source_db_conn = lazydb.LazyDb(self.source_db_config)
+            self.source_db_conn = lazydb.LazyDb(self.source_db_config, lazy=True)
 
-        self.tables = tables.Tables(config["tables_file"])
-        self.lobs = lobs.Lobs(config["lobs_file"])
+        if not prm_inputs:
+            prm_inputs = PrmInputs(
+                config, self.source_db_conn, verbose, metadata_cache, workers
+            )
+        self.prm_inputs = prm_inputs
+        self.tables = prm_inputs.tables
+        self.lobs = prm_inputs.lobs
+        self.table_columns = prm_inputs.table_columns
+        self.process_tables = prm_inputs.get_process_tables(self.process_config)
 
     """
     """
 
     def generate_process_prm(self):
         template_name = self.process_config["template"]["process"]
-        j2_process_template = common.read_j2_template(template_name)
-        common.write_j2_template(
+        j2_process_template = self.prm_inputs.get_j2_template(template_name)
+        if common.write_text_to_file_if_changed(
             self.process_config["prm_file_name"],
-            j2_process_template,
-            self.process_config,
-        )
+            j2_process_template.render(self.process_config),
+        ):
+            self.changed_files.append(self.process_config["prm_file_name"])
 
     """
     """
 
     def exec_sql_get_table_columns(self, table: tables.Table) -> list:
-        sql = """
-SELECT column_name, data_type, data_length
-  FROM dba_tab_columns
- WHERE owner = :owner
-   AND table_name = :table_name
-"""
-        rows = self.source_db_conn.execute_sql(
-            sql=sql,
-            bind_data={"owner": table.owner, "table_name": table.table_name},
-        )
-        return rows
+        return self.table_columns.get(table)
 
     """
     returns the list of column names that require a fetchcol
@@ -141,80 +280,180 @@ SELECT column_name, data_type, data_length
     """
     """
 
-    def write_tables_prm(self, table_prm_files: list[str], content: list[str]):
-        current_chunk = []
+    def open_tables_prm(self, table_prm_files: list[str], file_index: int):
+        # with a pattern, the file names are generated as needed
+        pattern = self.process_config.get("prm_table_file_name_pattern")
+        if pattern and file_index == len(table_prm_files):
+            table_prm_files.append(pattern.format(n=file_index + 1))
+        if file_index >= len(table_prm_files):
+            raise InsufficientFilesError(
+                f"Not enough files provided. Provided: {len(table_prm_files)} for process: {self.process_config['process_name']} "
+            )
+        # the file is written into a temporary file and only replaced if its content changed
+        return open(table_prm_files[file_index] + ".tmp", "w")
+
+    """
+    replaces the tables prm with its temporary file if the content changed
+    """
+
+    def replace_tables_prm(self, tmp_fn: str):
+        out_fn = tmp_fn.removesuffix(".tmp")
+        if common.replace_file_if_changed(tmp_fn, out_fn):
+            self.changed_files.append(out_fn)
+
+    """
+    writes the content into the files, every file gets at most max_number_lines_per_default_tables_prm lines
+    the content is consumed as a stream, only the lines of the current element are kept in memory
+    the files are written as temporary files and only replaced once the number of files is checked,
+    if it is wrong the temporary files are removed and the existing files are left untouched
+    returns the list of written files
+    """
+
+    def write_tables_prm(self, table_prm_files: list[str], content) -> list[str]:
+        fh = None
+        tmp_fns = []
         line_count = 0
         file_index = 0
         max_number_lines = self.process_config[
             "max_number_lines_per_default_tables_prm"
         ]
-        # Calculate the total number of lines in content
-        total_lines = sum(len(text.splitlines()) for text in content)
+        try:
+            for text in content:
+                # Split the current string into lines
+                lines = text.splitlines()
+                num_lines = len(lines)
+
+                # Check if adding this element would exceed the limit
+                if line_count + num_lines > max_number_lines:
+                    # Close the current file and continue with the next one
+                    if not fh:
+                        fh = self.open_tables_prm(table_prm_files, file_index)
+                        tmp_fns.append(fh.name)
+                    fh.close()
+                    fh = None
+                    line_count = 0
+                    file_index += 1
 
-        # Calculate the required number of files based on the total lines
-        required_files = (total_lines // max_number_lines) + (
-            1 if total_lines % max_number_lines > 0 else 0
-        )
+                if not fh and num_lines:
+                    fh = self.open_tables_prm(table_prm_files, file_index)
+                    tmp_fns.append(fh.name)
+
+                # Write the lines of the current element, separated by new lines
+                for line in lines:
+                    if line_count:
+                        fh.write("\n")
+                    fh.write(line)
+                    line_count += 1
+            if fh:
+                fh.close()
+
+            written_files = table_prm_files[
+                : file_index + 1 if line_count else file_index
+            ]
+            if len(written_files) < len(table_prm_files):
+                raise ExcessiveFilesWarning(
+                    f"There are {len(table_prm_files) - len(written_files)} unused files provided for process: {self.process_config['process_name']}"
+                )
+        except BaseException:
+            if fh:
+                fh.close()
+            for tmp_fn in tmp_fns:
+                os.remove(tmp_fn)
+            raise
+        for tmp_fn in tmp_fns:
+            self.replace_tables_prm(tmp_fn)
+        return written_files
 
-        # Check if there are enough files and if there are too many files
-        if required_files > len(table_prm_files):
-            raise InsufficientFilesError(
-                f"Not enough files provided. Required: {required_files}, Provided: {len(table_prm_files)} for process: {self.process_config['process_name']} "
-            )
-        if required_files < len(table_prm_files):
-            raise ExcessiveFilesWarning(
-                f"There are {len(table_prm_files) - required_files} unused files provided for process: {self.process_config['process_name']}"
-            )
+    """
+    generates the prm for the tables, for all tables
+    """
 
-        for text in content:
-            # Split the current string into lines
-            lines = text.splitlines()
-            num_lines = len(lines)
-
-            # Check if adding this element would exceed the limit
-            if line_count + num_lines > max_number_lines:
-                # Write the current chunk to the next file if available
-                if file_index < len(table_prm_files):
-                    common.write_text_to_file(
-                        table_prm_files[file_index], "\n".join(current_chunk)
-                    )
-                    # Prepare for the next chunk
-                    current_chunk = []
-                    line_count = 0
-                    file_index += 1
-                else:
+    def generate_process_tables_prm(self):
+        template_name = self.process_config["template"]["process_tables"]
+        j2_table_template = self.prm_inputs.get_j2_template(template_name)
+        if self.process_type == "extract" and self.genfetchcols:
+            # fetch the columns of all tables at once instead of one query per table
+            self.table_columns.load(self.process_tables)
+        if self.prm_manifest:
+            inputs_hash, table_hashes = self.hash_tables_prm_inputs(template_name)
+            self.prm_manifest.report_tables(self.process_key, table_hashes)
+            if self.prm_manifest.is_unchanged(self.process_key, inputs_hash):
+                if self.verbose:
                     print(
-                        f"Warning: No more files available to write chunk {file_index + 1}"
+                        f"process: {self.process_key} tables prm files are up to date"
                     )
-                    break  # Stop processing if there are no more files
+                self.process_config[
+                    "prm_table_file_name"
+                ] = self.prm_manifest.get_table_files(self.process_key)
+                return
+        # the tables are rendered in parallel and streamed to the writer in the order of the tables
+        prm_tables_content = common.ordered_imap(
+            lambda table: j2_table_template.render(self.gen_table_mapping(table)),
+            self.process_tables,
+            self.workers,
+        )
+        prm_table_file_names = self.get_table_prm_file_names()
+        written_files = self.write_tables_prm(prm_table_file_names, prm_tables_content)
+        # the process prm includes the files which were actually written
+        self.process_config["prm_table_file_name"] = written_files
+        if "prm_table_file_name_pattern" in self.process_config:
+            self.remove_stale_tables_prms(len(written_files))
+        if self.prm_manifest:
+            self.prm_manifest.update(
+                self.process_key, inputs_hash, table_hashes, written_files
+            )
 
-            # Add the lines of the current element to the current chunk
-            current_chunk.extend(lines)
-            line_count += num_lines
+    """
+    returns the hash of all inputs of the tables prm files and the hash of the inputs of each table
+    """
 
-        # Write any remaining lines in the current chunk to a file
-        if current_chunk and file_index < len(table_prm_files):
-            common.write_text_to_file(
-                table_prm_files[file_index], "\n".join(current_chunk)
+    def hash_tables_prm_inputs(self, template_name: str) -> tuple[str, dict[str, str]]:
+        table_hashes = [
+            (
+                f"{table.owner}.{table.table_name}",
+                manifest.hash_value(self.gen_table_mapping(table)),
             )
+            for table in self.process_tables
+        ]
+        inputs_hash = manifest.hash_value(
+            [
+                manifest.hash_file(template_name),
+                self.process_config["max_number_lines_per_default_tables_prm"],
+                self.process_config.get("prm_table_file_name_pattern"),
+                self.get_table_prm_file_names(),
+                table_hashes,
+            ]
+        )
+        return inputs_hash, dict(table_hashes)
 
     """
-    generates the prm for the tables, for all tables
+    returns the configured table prm files, an empty list if they are generated from a pattern
     """
 
-    def generate_process_tables_prm(self):
-        template_name = self.process_config["template"]["process_tables"]
-        j2_table_template = common.read_j2_template(template_name)
-        prm_tables_content = []
-        for table in self.tables.tables:
-            table_mapping = self.gen_table_mapping(table)
-            prm_tables_content.append(j2_table_template.render(table_mapping))
+    def get_table_prm_file_names(self) -> list[str]:
+        if "prm_table_file_name_pattern" in self.process_config:
+            if "{n}" not in self.process_config["prm_table_file_name_pattern"]:
+                raise Exception(
+                    f"prm_table_file_name_pattern of process: {self.process_config['process_name']} does not contain {{n}}"
+                )
+            return []
         # for backward compatibility, if prm_table_file_name containts only a file, make a list of it
         if isinstance(self.process_config["prm_table_file_name"], str):
-            prm_table_file_names = [self.process_config["prm_table_file_name"]]
-        else:
-            prm_table_file_names = self.process_config["prm_table_file_name"]
-        self.write_tables_prm(prm_table_file_names, prm_tables_content)
+            return [self.process_config["prm_table_file_name"]]
+        return list(self.process_config["prm_table_file_name"])
+
+    """
+    removes the files of a previous run with more shards than the current one
+    """
+
+    def remove_stale_tables_prms(self, number_of_files: int):
+        pattern = self.process_config["prm_table_file_name_pattern"]
+        n = number_of_files + 1
+        while os.path.exists(pattern.format(n=n)):
+            if self.verbose:
+                print(f"removing stale file {pattern.format(n=n)}")
+            os.remove(pattern.format(n=n))
+            n += 1
 
 
 """
@@ -230,6 +469,22 @@ def init_argparse() -> argparse.ArgumentParser:
     parser.add_argument("env", choices=VALID_ENVS, help="environment")
     parser.add_argument("-v", "--verbose", action="store_true", help="verbose")
     parser.add_argument("--pwd_source_db", help="Password for source db")
+    parser.add_argument(
+        "--no_metadata_cache",
+        action="store_true",
+        help="ignore the local metadata cache and query all tables from the source db",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="skips the tables prms of the processes whose inputs did not change since the last run",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="number of threads and source db sessions used to generate the tables prms",
+    )
     return parser
 
 
@@ -239,27 +494,77 @@ gen_prms
 
 
 def gen_prms(
-    config: dict[str:any], env: str, pwd_source_db: str = None, verbose: bool = False
-):
+    config: dict[str:any],
+    env: str,
+    pwd_source_db: str = None,
+    verbose: bool = False,
+    use_metadata_cache: bool = True,
+    workers: int = 1,
+    incremental: bool = False,
+    source_db_conn: lazydb.LazyDb = None,
+) -> list[str]:
     config_env = config[env]
+    common.init_j2_bytecode_cache_dir(config)
     if pwd_source_db:
         config_env["source_db"]["password"] = pwd_source_db
-    source_db_conn = lazydb.LazyDb(config_env["source_db"])
-    for process_type in config_env["processes"]:
+    # a connection given by the caller is left open for its next operations
+    close_source_db_conn = not source_db_conn
+    if not source_db_conn:
+        # with more than one worker, the workers share a pool of source db sessions
+        # the source db is connected by the first query
+        source_db_conn = lazydb.LazyDb(
+            config_env["source_db"],
+            pool_size=workers if workers > 1 else None,
+            lazy=True,
+        )
+    metadata_cache = None
+    if use_metadata_cache:
+        metadata_cache = metadata.MetadataCache(
+            source_db_conn,
+            config_env["source_db"]["dsn"],
+            config.get("metadata_cache_dir", metadata.DEFAULT_METADATA_CACHE_DIR),
+            verbose,
+            workers,
+        )
+    prm_manifest = None
+    if incremental:
+        prm_manifest = manifest.PrmManifest(
+            config.get("metadata_cache_dir", metadata.DEFAULT_METADATA_CACHE_DIR),
+            env,
+            verbose,
+        )
+    changed_files = []
+    # tables, lobs, metadata and templates are read once for all processes
+    prm_inputs = PrmInputs(
+        config_env, source_db_conn, verbose, metadata_cache, workers
+    )
+    for process_key in config_env["processes"]:
         enrich_process_config(
-            config, env, process_type, config_env["processes"][process_type]
+            config, env, process_key, config_env["processes"][process_key]
         )
         if verbose:
-            print(f"process: {process_type}")
-            pp(config_env["processes"][process_type])
+            print(f"process: {process_key}")
+            pp(config_env["processes"][process_key])
         process_prm_generator = PrmGenerator(
-            process_type,
+            process_key,
             config_env,
             source_db_conn,
             verbose,
+            metadata_cache,
+            workers,
+            prm_inputs,
+            prm_manifest,
         )
         process_prm_generator.generate_process_tables_prm()
         process_prm_generator.generate_process_prm()
+        changed_files += process_prm_generator.changed_files
+    if metadata_cache:
+        metadata_cache.close()
+    if close_source_db_conn:
+        source_db_conn.close()
+    if prm_manifest:
+        prm_manifest.save(changed_files)
+    return changed_files
 
 
 """
@@ -269,7 +574,16 @@ do_work
 
 def do_work(args):
     config = common.read_json(args.config_file)
-    gen_prms(config, args.env, args.pwd_source_db, args.verbose)
+    changed_files = gen_prms(
+        config,
+        args.env,
+        args.pwd_source_db,
+        args.verbose,
+        not args.no_metadata_cache,
+        args.workers,
+        args.incremental,
+    )
+    print(f"changed files: {', '.join(changed_files) if changed_files else 'none'}")
 
 
 """
@@ -279,11 +593,16 @@ def do_work(args):
 def enrich_process_config(config, env, process, process_config):
     # add env
     process_config["env"] = env
-    # trail info is not at the process level, but one level higher
-    process_config["trail"] = config[env]["trail"]
+    # the key of the process is the type, unless there are several processes of the same type
+    process_config["process_type"] = get_process_type(process, process_config)
+    # trail info can be at the process level, otherwise take the trail of the environment
+    if "trail" not in process_config:
+        process_config["trail"] = config[env]["trail"]
     # template can be at the process level, otherwise take the default template
     if "template" not in process_config:
-        process_config["template"] = config["default_templates"][process]
+        process_config["template"] = config["default_templates"][
+            process_config["process_type"]
+        ]
     # max_number_lines_per_default_tables_prm can be at the process level, otherwise take the default template
     if "max_number_lines_per_default_tables_prm" not in process_config:
         process_config["max_number_lines_per_default_tables_prm"] = config[
@@ -4,16 +4,17 @@
 Script to interact with Oracle GoldenGate Microservices Architecture (MA)
 """
 
-from getpass import getpass
-from pprint import pprint as pp
-from requests.auth import HTTPBasicAuth
-
 import argparse
+import codecs
+import functools
+import hashlib
 import json
+import os
 import posixpath
-import requests
 import string
 import sys
+import threading
+import time
 import urllib.parse
 
 import common
@@ -23,8 +24,51 @@ from constants import VALID_ENVS
 Constants
 """
 GG_ADMIN_URL_PATH_PREFIX = "services/v2"
-ALL_COMMANDS = common.read_json("ogg_rest_endpoints_def.json")
+ALL_COMMANDS_FN = "ogg_rest_endpoints_def.json"
 REST_OK_STATUS_CODE = [200, 201]
+DEFAULT_HTTP_POOL_MAXSIZE = 10
+DEFAULT_WAIT_TIMEOUT = 600
+# seconds a response of a get command is reused, 0 disables the cache
+DEFAULT_RESPONSE_CACHE_TTL = 0
+STREAM_KEY = "items"
+STREAM_CHUNK_SIZE = 64 * 1024
+STREAM_MARKER_FIELD = "issued"
+DEFAULT_STREAM_POLL_INTERVAL = 5
+BATCH_COMMAND = "batch"
+BATCH_RECORD_KEYS = [
+    "id",
+    "command",
+    "command_arg",
+    "command_arg_fn",
+    "command_args_json",
+    "after",
+]
+
+
+"""
+returns the catalog of the commands, read on first use
+the catalog is searched in the current directory, then in the directory of this script
+"""
+
+
+@functools.lru_cache(maxsize=None)
+def get_all_commands() -> dict:
+    if os.path.exists(ALL_COMMANDS_FN):
+        return common.read_json(ALL_COMMANDS_FN)
+    return common.read_json(
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), ALL_COMMANDS_FN)
+    )
+
+
+"""
+gg.ALL_COMMANDS is still available, but the catalog is read only when it is used
+"""
+
+
+def __getattr__(name):
+    if name == "ALL_COMMANDS":
+        return get_all_commands()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 """
@@ -74,36 +118,399 @@ def gen_todo(command_args_dict: dict | None, command_arg_fn: str | None) -> dict
 
 
 """
-do_call
+yields the elements of the first array named key of a json document given as chunks of bytes
+only the current element is kept in memory, if there is no such array the whole document is yielded
 """
 
 
-def do_http_call(
-    url, gg_api_endpoint, op, todo, client_cert, client_key, verify_cert
-) -> requests.Response:
-    if op and url:
-        op_call = getattr(requests, op)
-        res = None
-        if client_cert and client_key:
-            if todo:
-                res = op_call(
-                    url, cert=(client_cert, client_key), json=todo, verify=verify_cert
-                )
+def iter_json_array_items(chunks, key: str = STREAM_KEY):
+    decoder = json.JSONDecoder()
+    utf8_decoder = codecs.getincrementaldecoder("utf-8")()
+    chunks = iter(chunks)
+    buffer = ""
+    eof = False
+
+    def read_more():
+        nonlocal buffer, eof
+        chunk = next(chunks, None)
+        if chunk is None:
+            eof = True
+            buffer += utf8_decoder.decode(b"", final=True)
+        else:
+            buffer += utf8_decoder.decode(chunk)
+
+    # looks for the string "key" followed by : and [ outside of any other string
+    key_token = json.dumps(key)
+    pos = 0
+    in_string = False
+    escaped = False
+    string_start = 0
+    found = False
+    while not found:
+        if pos >= len(buffer):
+            if eof:
+                yield json.loads(buffer)
+                return
+            read_more()
+            continue
+        char = buffer[pos]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+                if buffer[string_start : pos + 1] == key_token:
+                    # the rest of the token may not be downloaded yet
+                    rest = buffer[pos + 1 :].lstrip()
+                    while not eof and not rest[1:].strip():
+                        read_more()
+                        rest = buffer[pos + 1 :].lstrip()
+                    if rest.startswith(":") and rest[1:].lstrip().startswith("["):
+                        pos = buffer.index("[", pos + 1) + 1
+                        found = True
+                        continue
+        elif char == '"':
+            in_string = True
+            string_start = pos
+        pos += 1
+
+    # decodes the elements of the array one by one, the decoded text is dropped from the buffer
+    buffer = buffer[pos:]
+    while True:
+        stripped = buffer.lstrip(" \t\r\n,")
+        if not stripped:
+            if eof:
+                raise Exception(f"incomplete json array: {key}")
+            buffer = stripped
+            read_more()
+            continue
+        if stripped[0] == "]":
+            return
+        try:
+            item, end = decoder.raw_decode(stripped)
+        except json.JSONDecodeError:
+            end = None
+        # the element is complete only if it is followed by a delimiter, a number may continue in the next chunk
+        if end is None or end == len(stripped) or stripped[end] not in " \t\r\n,]":
+            if eof:
+                raise Exception(f"invalid json in the array: {key}")
+            buffer = stripped
+            read_more()
+            continue
+        yield item
+        buffer = stripped[end:]
+
+
+"""
+returns True if one of the url paths is the other or one of its parents
+"""
+
+
+def is_related_path(path: str, other_path: str) -> bool:
+    path = path.rstrip("/")
+    other_path = other_path.rstrip("/")
+    return (
+        path == other_path
+        or path.startswith(other_path + "/")
+        or other_path.startswith(path + "/")
+    )
+
+
+"""
+cache of the responses of the get commands, shared by all the clients of the process
+the entries are keyed by the auth identity and the url and expire after their ttl
+"""
+
+
+class GgResponseCache:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (identity, url) -> (expiration time, response)
+        self.entries = {}
+        # (identity, url) -> number of invalidations, a response read before an invalidation is not stored
+        self.generations = {}
+
+    """
+    returns the cached response, None if there is no valid entry
+    """
+
+    def get(self, identity: str, url: str) -> "requests.Response | None":
+        with self.lock:
+            entry = self.entries.get((identity, url))
+            if entry and entry[0] > time.monotonic():
+                return entry[1]
+            self.entries.pop((identity, url), None)
+            return None
+
+    """
+    returns the generation of the entry, to be read before the http call and given to put
+    """
+
+    def get_generation(self, identity: str, url: str) -> int:
+        with self.lock:
+            return self.generations.setdefault((identity, url), 0)
+
+    """
+    stores the response, unless the entry was invalidated since generation was read
+    """
+
+    def put(
+        self,
+        identity: str,
+        url: str,
+        resp: "requests.Response",
+        ttl: float,
+        generation: int,
+    ):
+        with self.lock:
+            if self.generations.get((identity, url)) == generation:
+                self.entries[(identity, url)] = (time.monotonic() + ttl, resp)
+
+    """
+    removes the entries of all identities whose url is on the same host as base_url and
+    whose path is one of the given paths, one of their parents or one of their children
+    all the entries are removed if no path is given
+    the generation of the entries is increased, also for the calls still running
+    """
+
+    def invalidate(self, base_url: str | None = None, paths: list[str] | None = None):
+        netloc = urllib.parse.urlsplit(base_url).netloc if base_url else None
+        with self.lock:
+            for identity, url in list(self.generations):
+                parsed_url = urllib.parse.urlsplit(url)
+                if netloc and parsed_url.netloc != netloc:
+                    continue
+                if paths is None or any(
+                    is_related_path(parsed_url.path, path) for path in paths
+                ):
+                    self.generations[(identity, url)] += 1
+                    self.entries.pop((identity, url), None)
+
+
+RESPONSE_CACHE = GgResponseCache()
+
+
+"""
+client for the ReST api of one gg endpoint
+all calls share one requests.Session, the connections (and the tls handshakes) are reused between calls
+"""
+
+
+class GgClient:
+    def __init__(
+        self,
+        config: dict,
+        env: str,
+        gg_api_endpoint_url: str | None = None,
+        password: str | None = None,
+        client_cert: str | None = None,
+        client_key: str | None = None,
+        verify_cert: str | None = None,
+        verbose: bool = False,
+        pool_maxsize: int = DEFAULT_HTTP_POOL_MAXSIZE,
+        timeout: float | tuple[float, float] | None = None,
+        gg_endpoint: str | None = None,
+        cache_ttl: float | None = None,
+    ):
+        self.verbose = verbose
+        self.timeout = timeout
+        # the endpoint of the environment, unless an endpoint is given by name
+        if gg_endpoint:
+            self.gg_endpoint = gg_endpoint
+        else:
+            self.gg_endpoint = config[env]["gg_endpoint"]
+        gg_api_endpoint = config["gg_endpoints"][self.gg_endpoint]
+        if gg_api_endpoint_url:
+            self.url = gg_api_endpoint_url
+        else:
+            self.url = gg_api_endpoint["url"]
+        if not verify_cert:
+            if "verify_cert" in gg_api_endpoint:
+                verify_cert = gg_api_endpoint["verify_cert"]
+            elif "default_verify_cert" in config:
+                verify_cert = config["default_verify_cert"]
             else:
-                res = op_call(url, cert=(client_cert, client_key), verify=verify_cert)
+                verify_cert = False
+        if cache_ttl is None:
+            cache_ttl = gg_api_endpoint.get(
+                "response_cache_ttl",
+                config.get("default_response_cache_ttl", DEFAULT_RESPONSE_CACHE_TTL),
+            )
+        self.cache_ttl = cache_ttl
+        # requests is slow to import, it is imported only when a client is created
+        import requests
+        from requests.adapters import HTTPAdapter
+        from requests.auth import HTTPBasicAuth
+
+        self.session = requests.Session()
+        self.session.verify = verify_cert
+        if client_cert and client_key:
+            self.session.cert = (client_cert, client_key)
+            self.identity = f"cert:{client_cert}"
         else:
-            auth_basic = HTTPBasicAuth(
-                gg_api_endpoint["user"], gg_api_endpoint["password"]
+            # the password is asked only once for all the calls of the client
+            if not password:
+                from getpass import getpass
+
+                password = getpass(f"Enter password for {gg_api_endpoint['user']}:")
+            self.session.auth = HTTPBasicAuth(gg_api_endpoint["user"], password)
+            self.identity = f"user:{gg_api_endpoint['user']}"
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    """
+    """
+
+    def __enter__(self):
+        return self
+
+    """
+    """
+
+    def __exit__(self, exception_type, exception_value, exception_traceback):
+        self.close()
+
+    """
+    closes the pooled connections
+    """
+
+    def close(self):
+        self.session.close()
+
+    """
+    do_call
+    """
+
+    def do_http_call(
+        self, url: str, op: str, todo: dict | None, stream: bool = False
+    ) -> "requests.Response":
+        if todo:
+            return self.session.request(
+                op, url, json=todo, timeout=self.timeout, stream=stream
+            )
+        return self.session.request(op, url, timeout=self.timeout, stream=stream)
+
+    """
+    removes the cached responses of the urls related to the url of the mutating command
+    """
+
+    def invalidate_cache(self, command_info: dict, url: str):
+        url_path = urllib.parse.urlsplit(url).path
+        paths = [posixpath.dirname(url_path.rstrip("/"))]
+        for url_suffix in command_info.get("invalidates", []):
+            paths.append(
+                urllib.parse.urlsplit(gen_url(self.url, url_suffix, None)).path
             )
+        RESPONSE_CACHE.invalidate(self.url, paths)
+
+    """
+    issues the command, exits if the http call fails and exit_on_http_err is set
+    the successful responses of get commands are cached for cache_ttl seconds, unless use_cache is False
+    the other commands invalidate the cached responses of their resource
+    with stream, the body of the response is not read and the cache is not used
+    """
+
+    def call(
+        self,
+        command: str,
+        command_arg: str | None = None,
+        command_arg_fn: str | None = None,
+        command_args_json: str | None = None,
+        exit_on_http_err: bool = True,
+        use_cache: bool = True,
+        stream: bool = False,
+    ) -> "requests.Response":
+        command_args_dict = None
+        if command_args_json:
+            command_args_dict = json.loads(command_args_json)
+            if self.verbose:
+                from pprint import pprint as pp
+
+                print("Read following JSON arguments:")
+                pp(command_args_dict)
+
+        command_info = get_all_commands()[command]
+        url = gen_url(self.url, command_info["url_suffix"], command_arg)
+        if self.verbose:
+            print(f"Using the following URL: {url}")
+        todo = gen_todo(command_args_dict, command_arg_fn)
+        if self.verbose:
+            print(f"Generated following todo: {todo}")
+            print(f"Will issue a {command_info['op']}")
+
+        cacheable = command_info["op"] == "get" and self.cache_ttl > 0 and not stream
+        resp = None
+        if cacheable and use_cache:
+            resp = RESPONSE_CACHE.get(self.identity, url)
+            if resp is not None and self.verbose:
+                print(f"Using the cached response of {url}")
+        if resp is None:
+            if cacheable:
+                generation = RESPONSE_CACHE.get_generation(self.identity, url)
+            resp = self.do_http_call(url, command_info["op"], todo, stream)
+            if command_info["op"] != "get":
+                self.invalidate_cache(command_info, url)
+            elif cacheable and resp.status_code in REST_OK_STATUS_CODE:
+                RESPONSE_CACHE.put(
+                    self.identity, url, resp, self.cache_ttl, generation
+                )
+
+        if resp.status_code in REST_OK_STATUS_CODE or not exit_on_http_err:
+            return resp
+        else:
+            sys.stderr.write("HTTP Call returned : " + str(resp.status_code) + "\n")
+            sys.stderr.write("URL: " + url + "\n")
+            sys.stderr.write("OP: " + command_info["op"] + "\n")
             if todo:
-                res = op_call(url, auth=auth_basic, json=todo, verify=verify_cert)
-            else:
-                res = op_call(url, auth=auth_basic, verify=verify_cert)
-        return res
+                sys.stderr.write("TODO: " + str(todo) + "\n")
+
+            sys.exit(1)
+
+    """
+    polls the status of the process until it is one of statuses, returns the status
+    raises TimeoutError if the process does not reach the status within timeout seconds
+    """
+
+    def wait_for_status(
+        self,
+        retrieve_status_command: str,
+        process_name: str,
+        statuses: list[str],
+        timeout: float = DEFAULT_WAIT_TIMEOUT,
+    ) -> str:
+        def get_status():
+            resp = self.call(
+                retrieve_status_command, process_name, use_cache=False
+            ).json()
+            return resp["response"]["status"]
+
+        def on_wait(status, delay):
+            if self.verbose:
+                print(f"Status returned: {status}, waiting {delay:.1f}s...")
+
+        return common.poll_until(
+            get_status, lambda status: status in statuses, timeout, on_wait=on_wait
+        )
+
+    """
+    yields the elements of the array key of the response one by one, while the response is downloaded
+    """
+
+    def stream(
+        self, command: str, command_arg: str | None = None, key: str = STREAM_KEY
+    ):
+        with self.call(command, command_arg, use_cache=False, stream=True) as resp:
+            yield from iter_json_array_items(
+                resp.iter_content(chunk_size=STREAM_CHUNK_SIZE), key
+            )
 
 
 """
 do_work
+if a client is given, its session is reused and the connection arguments are ignored
 """
 
 
@@ -121,63 +528,215 @@ def do_work(
     verify_cert: str | None = None,
     verbose: bool = False,
     exit_on_http_err: bool = True,
-) -> requests.Response:
-    command_args_dict = None
-    if command_args_json:
-        command_args_dict = json.loads(command_args_json)
-        if verbose:
-            print("Read following JSON arguments:")
-            pp(command_args_dict)
-
-    gg_api_endpoint_env = config[env]["gg_endpoint"]
-    gg_api_endpoint = config["gg_endpoints"][gg_api_endpoint_env]
-    if gg_api_endpoint_url:
-        url = gg_api_endpoint_url
-    else:
-        url = gg_api_endpoint["url"]
-    if not client_cert or not client_key:
-        if password:
-            gg_api_endpoint["password"] = password
-        else:
-            gg_api_endpoint["password"] = getpass(
-                f"Enter password for {gg_api_endpoint['user']}:"
-            )
-    command_info = ALL_COMMANDS[command]
-    url = gen_url(url, command_info["url_suffix"], command_arg)
-    if verbose:
-        print(f"Using the following URL: {url}")
-    todo = gen_todo(command_args_dict, command_arg_fn)
-    if verbose:
-        print(f"Generated following todo: {todo}")
-        print(f"Will issue a {command_info['op']}")
-    if not verify_cert:
-        if "verify_cert" in gg_api_endpoint:
-            verify_cert = gg_api_endpoint["verify_cert"]
-        elif "default_verify_cert" in config:
-            verify_cert = config["default_verify_cert"]
-        else:
-            verify_cert = False
-
-    resp = do_http_call(
-        url,
-        gg_api_endpoint,
-        command_info["op"],
-        todo,
+    client: GgClient | None = None,
+) -> "requests.Response":
+    if client:
+        return client.call(
+            command, command_arg, command_arg_fn, command_args_json, exit_on_http_err
+        )
+    with GgClient(
+        config,
+        env,
+        gg_api_endpoint_url,
+        password,
         client_cert,
         client_key,
         verify_cert,
-    )
+        verbose,
+    ) as client:
+        return client.call(
+            command, command_arg, command_arg_fn, command_args_json, exit_on_http_err
+        )
+
+
+"""
+reads the records of a batch file (a json list or one json object per line), - is stdin
+every record has a command and optionally command_arg, command_arg_fn, command_args_json (string or object),
+an id and after, the ids of the records which must be done before
+"""
 
-    if resp.status_code in REST_OK_STATUS_CODE or not exit_on_http_err:
-        return resp
+
+def read_batch_records(batch_fn: str) -> list[dict]:
+    if batch_fn == "-":
+        text = sys.stdin.read()
     else:
-        sys.stderr.write("HTTP Call returned : " + str(resp.status_code) + "\n")
-        sys.stderr.write("URL: " + url + "\n")
-        sys.stderr.write("OP: " + command_info["op"] + "\n")
-        if todo:
-            sys.stderr.write("TODO: " + str(todo) + "\n")
+        with open(batch_fn) as fh:
+            text = fh.read()
+    if text.lstrip().startswith("["):
+        records = json.loads(text)
+    else:
+        records = [json.loads(line) for line in text.splitlines() if line.strip()]
+    ids = set()
+    for i, record in enumerate(records):
+        if not isinstance(record, dict):
+            raise Exception(f"record {i + 1}: not a json object")
+        unknown_keys = record.keys() - set(BATCH_RECORD_KEYS)
+        if unknown_keys:
+            raise Exception(f"record {i + 1}: unknown keys {sorted(unknown_keys)}")
+        if record.get("command") not in get_all_commands():
+            raise Exception(f"record {i + 1}: unknown command {record.get('command')}")
+        if record.get("command_arg_fn") and record.get("command_args_json"):
+            raise Exception(
+                f"record {i + 1}: command_arg_fn and command_args_json are mutually exclusive"
+            )
+        if not isinstance(record.get("command_args_json", ""), str):
+            record["command_args_json"] = json.dumps(record["command_args_json"])
+        after = record.get("after", [])
+        if isinstance(after, str):
+            after = [after]
+        if not isinstance(after, list) or not all(
+            isinstance(after_id, (str, int)) for after_id in after
+        ):
+            raise Exception(f"record {i + 1}: after must be an id or a list of ids")
+        record["after"] = [str(after_id) for after_id in after]
+        record["id"] = str(record.get("id", i + 1))
+        if record["id"] in ids:
+            raise Exception(f"record {i + 1}: duplicate id {record['id']}")
+        ids.add(record["id"])
+    for i, record in enumerate(records):
+        unknown_ids = [after_id for after_id in record["after"] if after_id not in ids]
+        if unknown_ids:
+            raise Exception(f"record {i + 1}: after unknown ids {unknown_ids}")
+    return records
 
-        sys.exit(1)
+
+"""
+runs the records of a batch over the client, records without ordering run in parallel
+on_result is called with the result of every record as soon as it is done
+returns True if all the records succeeded
+"""
+
+
+def run_batch(client: GgClient, records: list[dict], parallel: int = 1, on_result=None):
+    results = {}
+
+    def run_record(record):
+        result = {"id": record["id"], "command": record["command"]}
+        if record.get("command_arg"):
+            result["command_arg"] = record["command_arg"]
+        failed = [dep for dep in record.get("after", []) if not results[dep]["ok"]]
+        if failed:
+            result.update(ok=False, skipped=True, error=f"failed records: {failed}")
+            return result
+        start = time.perf_counter()
+        try:
+            resp = client.call(
+                record["command"],
+                record.get("command_arg"),
+                record.get("command_arg_fn"),
+                record.get("command_args_json"),
+                exit_on_http_err=False,
+            )
+            result["status_code"] = resp.status_code
+            result["ok"] = resp.status_code in REST_OK_STATUS_CODE
+            if result["ok"]:
+                result["response"] = resp.json()
+            else:
+                result["error"] = resp.text
+        except Exception as e:
+            result.update(ok=False, error=f"{type(e).__name__}: {e}")
+        result["seconds"] = round(time.perf_counter() - start, 3)
+        return result
+
+    def record_done(record_id, result):
+        results[record_id] = result
+        if on_result:
+            on_result(result)
+
+    common.run_dependency_graph(
+        {record["id"]: functools.partial(run_record, record) for record in records},
+        {record["id"]: record.get("after", []) for record in records},
+        parallel,
+        record_done,
+    )
+    return all(result["ok"] for result in results.values())
+
+
+"""
+returns a stable digest of a record, used to recognize a record between the polls and the runs
+"""
+
+
+def get_record_digest(record) -> str:
+    return hashlib.sha1(json.dumps(record, sort_keys=True).encode()).hexdigest()
+
+
+"""
+streams the records of the command (logs, messages, events) to on_record as soon as they are downloaded
+with follow, the command is repeated every poll_interval seconds and only the new records are streamed
+a record is new if its marker_field is greater than the last marker, or equal to it and not streamed yet:
+the markers have a resolution of one second, a record can come with the last marker in a later poll
+the last marker and the digests of the records streamed with it are kept in since_fn (one per line)
+with a given since, without digests, the records with the marker since are not streamed
+records without marker_field are new if they were not in the previous poll
+returns the last marker
+"""
+
+
+def stream_records(
+    client: GgClient,
+    command: str,
+    command_arg: str | None = None,
+    follow: bool = False,
+    since: str | None = None,
+    since_fn: str | None = None,
+    marker_field: str = STREAM_MARKER_FIELD,
+    poll_interval: float = DEFAULT_STREAM_POLL_INTERVAL,
+    key: str = STREAM_KEY,
+    on_record=None,
+) -> str | None:
+    # digests of the records streamed with the marker since, None if they are unknown
+    since_digests = None
+    if not since and since_fn and os.path.exists(since_fn):
+        with open(since_fn) as fh:
+            lines = fh.read().splitlines()
+        if lines:
+            since = lines[0]
+            if len(lines) > 1:
+                since_digests = set(lines[1:])
+    previous_records = set()
+    while True:
+        marker = since
+        marker_digests = since_digests
+        current_records = set()
+        for record in client.stream(command, command_arg, key):
+            record_marker = (
+                record.get(marker_field) if isinstance(record, dict) else None
+            )
+            if record_marker is not None:
+                record_marker = str(record_marker)
+                record_digest = get_record_digest(record)
+                if since is not None:
+                    if record_marker < since:
+                        continue
+                    if record_marker == since and (
+                        since_digests is None or record_digest in since_digests
+                    ):
+                        continue
+                if marker is None or record_marker > marker:
+                    marker = record_marker
+                    marker_digests = set()
+                if record_marker == marker:
+                    marker_digests = (marker_digests or set()) | {record_digest}
+            else:
+                record_hash = hash(json.dumps(record, sort_keys=True))
+                current_records.add(record_hash)
+                if record_hash in previous_records:
+                    continue
+            if on_record:
+                on_record(record)
+        previous_records = current_records
+        if since_fn and marker is not None and (
+            marker != since or marker_digests != since_digests
+        ):
+            common.write_text_to_file(
+                since_fn, "\n".join([marker, *sorted(marker_digests or [])]) + "\n"
+            )
+        since = marker
+        since_digests = marker_digests
+        if not follow:
+            return since
+        time.sleep(poll_interval)
 
 
 """
@@ -233,11 +792,27 @@ Common Commands
 
     ./gg.py config.json prod execute_command --command_args_json '{"name": "start", "processName": "REP", "processType": "replicat"}'
     ./gg.py config.json prod execute_command --command_args_json '{"name": "start", "processName": "EXT", "processType": "extract"}'
+
+Batch of Commands (one json object per line, printed results are one json object per line)
+
+    ./gg.py config.json prod batch --batch_fn commands.ndjson --parallel 4
+
+    {"id": "ext", "command": "extract_retrieve_status", "command_arg": "EXT"}
+    {"id": "rep", "command": "replicat_retrieve_status", "command_arg": "REP"}
+    {"command": "extract_issue_command", "command_arg": "EXT", "command_args_json": {"command": "STOP"}, "after": ["ext", "rep"]}
+
+Streaming of Messages (one json object per line, new messages are printed every 10 seconds)
+
+    ./gg.py config.json prod messages --stream --follow --poll_interval 10 --since_fn messages.since
 """,
     )
     parser.add_argument("config_file", help="config file (json)")
     parser.add_argument("env", choices=VALID_ENVS, help="environment")
-    parser.add_argument("command", choices=list(ALL_COMMANDS), help="command")
+    parser.add_argument(
+        "command",
+        choices=list(get_all_commands()) + [BATCH_COMMAND],
+        help=f"command, {BATCH_COMMAND} runs the commands of --batch_fn",
+    )
     parser.add_argument("--client_cert", help="path to a client certificate file")
     parser.add_argument("--client_key", help="path to a client key file")
     parser.add_argument("--command_arg", help="single argument for the command")
@@ -250,6 +825,45 @@ Common Commands
     parser.add_argument(
         "--verify_cert", help="path to a file to verify the server certificates"
     )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="prints the records of the response as soon as they are downloaded, one json per line",
+    )
+    parser.add_argument(
+        "--follow",
+        action="store_true",
+        help="with --stream, polls the command and prints only the new records",
+    )
+    parser.add_argument(
+        "--since", help="with --stream, prints only the records after this marker"
+    )
+    parser.add_argument(
+        "--since_fn",
+        help="with --stream, file keeping the last marker and its records between the runs",
+    )
+    parser.add_argument(
+        "--marker_field",
+        default=STREAM_MARKER_FIELD,
+        help="field of the records used as marker",
+    )
+    parser.add_argument(
+        "--poll_interval",
+        type=float,
+        default=DEFAULT_STREAM_POLL_INTERVAL,
+        help="seconds between the polls of --follow",
+    )
+    parser.add_argument(
+        "--batch_fn",
+        default="-",
+        help="file with the commands of the batch (json or ndjson), default is stdin",
+    )
+    parser.add_argument(
+        "--parallel",
+        type=int,
+        default=1,
+        help="number of batch commands running at the same time",
+    )
     parser.add_argument(
         "-v", "--verbose", action="store_true", help="increase output verbosity"
     )
@@ -265,6 +879,54 @@ def main():
     parser = init_argparse()
     args = parser.parse_args()
     config = common.read_json(args.config_file)
+    if args.command == BATCH_COMMAND:
+        records = read_batch_records(args.batch_fn)
+        with GgClient(
+            config,
+            args.env,
+            args.gg_endpoint_url,
+            args.password,
+            args.client_cert,
+            args.client_key,
+            args.verify_cert,
+            args.verbose,
+            pool_maxsize=max(args.parallel, DEFAULT_HTTP_POOL_MAXSIZE),
+        ) as client:
+            ok = run_batch(
+                client,
+                records,
+                args.parallel,
+                lambda result: print(json.dumps(result), flush=True),
+            )
+        if not ok:
+            sys.exit(1)
+        return
+    if args.stream or args.follow:
+        with GgClient(
+            config,
+            args.env,
+            args.gg_endpoint_url,
+            args.password,
+            args.client_cert,
+            args.client_key,
+            args.verify_cert,
+            args.verbose,
+        ) as client:
+            try:
+                stream_records(
+                    client,
+                    args.command,
+                    args.command_arg,
+                    args.follow,
+                    args.since,
+                    args.since_fn,
+                    args.marker_field,
+                    args.poll_interval,
+                    on_record=lambda record: print(json.dumps(record), flush=True),
+                )
+            except KeyboardInterrupt:
+                pass
+        return
     resp = do_work(
         config,
         args.env,
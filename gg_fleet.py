@@ -0,0 +1,315 @@
+#!/usr/bin/env python
+
+"""
+Script to send one command to many Oracle GoldenGate Microservices Architecture (MA) deployments concurrently
+"""
+
+from getpass import getpass
+
+import argparse
+import json
+import sys
+import time
+
+import common
+import gg
+from constants import VALID_ENVS
+
+"""
+Constants
+"""
+DEFAULT_CONCURRENCY = 20
+DEFAULT_POOL_MAXSIZE_PER_HOST = 2
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 30
+
+
+"""
+returns the names of the gg endpoints of the given environments, all the gg endpoints if no environment is given
+"""
+
+
+def get_gg_endpoint_names(config: dict, envs: list[str] | None = None) -> list[str]:
+    if not envs:
+        return list(config["gg_endpoints"])
+    return list(dict.fromkeys(config[env]["gg_endpoint"] for env in envs))
+
+
+"""
+asks once for the password of every user of the given gg endpoints
+"""
+
+
+def ask_passwords(config: dict, gg_endpoint_names: list[str]) -> dict[str, str]:
+    passwords = {}
+    for gg_endpoint_name in gg_endpoint_names:
+        user = config["gg_endpoints"][gg_endpoint_name]["user"]
+        if user not in passwords:
+            passwords[user] = getpass(f"Enter password for {user}:")
+    return passwords
+
+
+"""
+client for the ReST api of many gg endpoints
+every endpoint has its own GgClient with a small connection pool, the calls run in a pool of
+concurrency threads, so at most concurrency calls are running at the same time
+"""
+
+
+class GgFleetClient:
+    def __init__(
+        self,
+        config: dict,
+        gg_endpoint_names: list[str],
+        passwords: dict[str, str] | None = None,
+        client_cert: str | None = None,
+        client_key: str | None = None,
+        verify_cert: str | None = None,
+        verbose: bool = False,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        pool_maxsize: int = DEFAULT_POOL_MAXSIZE_PER_HOST,
+        timeout: tuple[float, float] = (DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT),
+    ):
+        self.verbose = verbose
+        self.concurrency = concurrency
+        passwords = passwords or {}
+        gg_endpoints = config["gg_endpoints"]
+        self.clients = {
+            gg_endpoint_name: gg.GgClient(
+                config,
+                None,
+                password=passwords.get(gg_endpoints[gg_endpoint_name]["user"]),
+                client_cert=client_cert,
+                client_key=client_key,
+                verify_cert=verify_cert,
+                pool_maxsize=pool_maxsize,
+                timeout=timeout,
+                gg_endpoint=gg_endpoint_name,
+            )
+            for gg_endpoint_name in gg_endpoint_names
+        }
+
+    """
+    """
+
+    def __enter__(self):
+        return self
+
+    """
+    """
+
+    def __exit__(self, exception_type, exception_value, exception_traceback):
+        self.close()
+
+    """
+    closes the connection pools of all endpoints
+    """
+
+    def close(self):
+        for client in self.clients.values():
+            client.close()
+
+    """
+    issues the command against one endpoint, errors are returned in the result instead of being raised
+    """
+
+    def call_endpoint(
+        self,
+        gg_endpoint_name: str,
+        command: str,
+        command_arg: str | None = None,
+        command_args_json: str | None = None,
+    ) -> dict:
+        result = {"gg_endpoint": gg_endpoint_name, "status_code": None}
+        start = time.perf_counter()
+        try:
+            resp = self.clients[gg_endpoint_name].call(
+                command,
+                command_arg,
+                command_args_json=command_args_json,
+                exit_on_http_err=False,
+            )
+            result["status_code"] = resp.status_code
+            if resp.status_code not in gg.REST_OK_STATUS_CODE:
+                result["error"] = resp.text
+            else:
+                result["response"] = resp.json()
+        except Exception as e:
+            result["error"] = f"{type(e).__name__}: {e}"
+        result["seconds"] = round(time.perf_counter() - start, 3)
+        if self.verbose:
+            print(
+                f"{gg_endpoint_name}: {command} returned {result['status_code']} in {result['seconds']}s",
+                file=sys.stderr,
+            )
+        return result
+
+    """
+    issues the command against all endpoints in concurrency threads, returns the results in the order of the endpoints
+    """
+
+    def run(
+        self,
+        command: str,
+        command_arg: str | None = None,
+        command_args_json: str | None = None,
+    ) -> list[dict]:
+        return common.ordered_map(
+            lambda gg_endpoint_name: self.call_endpoint(
+                gg_endpoint_name, command, command_arg, command_args_json
+            ),
+            self.clients,
+            self.concurrency,
+        )
+
+
+"""
+do_work
+"""
+
+
+def do_work(
+    config: dict,
+    command: str,
+    envs: list[str] | None = None,
+    gg_endpoint_names: list[str] | None = None,
+    command_arg: str | None = None,
+    command_args_json: str | None = None,
+    password: str | None = None,
+    client_cert: str | None = None,
+    client_key: str | None = None,
+    verify_cert: str | None = None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    timeout: tuple[float, float] = (DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT),
+    verbose: bool = False,
+) -> list[dict]:
+    if not gg_endpoint_names:
+        gg_endpoint_names = get_gg_endpoint_names(config, envs)
+    passwords = None
+    if not client_cert or not client_key:
+        if password:
+            passwords = {
+                config["gg_endpoints"][gg_endpoint_name]["user"]: password
+                for gg_endpoint_name in gg_endpoint_names
+            }
+        else:
+            passwords = ask_passwords(config, gg_endpoint_names)
+    with GgFleetClient(
+        config,
+        gg_endpoint_names,
+        passwords,
+        client_cert,
+        client_key,
+        verify_cert,
+        verbose,
+        concurrency,
+        timeout=timeout,
+    ) as fleet_client:
+        return fleet_client.run(command, command_arg, command_args_json)
+
+
+"""
+initializes argparse
+"""
+
+
+def init_argparse() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="""
+Sends one command to many GG MA deployments concurrently, prints one json line per deployment
+        """,
+        formatter_class=argparse.RawTextHelpFormatter,
+        epilog="""
+Example 1: list the extracts of all the gg endpoints of the config
+
+    ./gg_fleet.py config.json list_extracts
+
+Example 2: status of the extract EXT on the gg endpoints of the prod and test environments
+
+    ./gg_fleet.py config.json extract_retrieve_status --command_arg EXT --envs prod test
+
+Example 3: at most 5 calls at the same time, 10 seconds read timeout
+
+    ./gg_fleet.py config.json list_replicats --gg_endpoints server1 server2 --concurrency 5 --read_timeout 10
+""",
+    )
+    parser.add_argument("config_file", help="config file (json)")
+    parser.add_argument("command", choices=list(gg.get_all_commands()), help="command")
+    parser.add_argument(
+        "--envs",
+        nargs="+",
+        choices=VALID_ENVS,
+        help="uses the gg endpoints of the environments",
+    )
+    parser.add_argument(
+        "--gg_endpoints", nargs="+", help="names of the gg endpoints, default is all"
+    )
+    parser.add_argument("--command_arg", help="single argument for the command")
+    parser.add_argument("--command_args_json", help="json as an arguement")
+    parser.add_argument("--client_cert", help="path to a client certificate file")
+    parser.add_argument("--client_key", help="path to a client key file")
+    parser.add_argument(
+        "--password",
+        help="password for the gg api of all endpoints, if not given, will be asked once per user",
+    )
+    parser.add_argument(
+        "--verify_cert", help="path to a file to verify the server certificates"
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help="maximum number of concurrent calls",
+    )
+    parser.add_argument(
+        "--connect_timeout",
+        type=float,
+        default=DEFAULT_CONNECT_TIMEOUT,
+        help="seconds to establish a connection",
+    )
+    parser.add_argument(
+        "--read_timeout",
+        type=float,
+        default=DEFAULT_READ_TIMEOUT,
+        help="seconds to wait for the response",
+    )
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", help="increase output verbosity"
+    )
+    return parser
+
+
+"""
+main
+"""
+
+
+def main():
+    parser = init_argparse()
+    args = parser.parse_args()
+    config = common.read_json(args.config_file)
+    results = do_work(
+        config,
+        args.command,
+        args.envs,
+        args.gg_endpoints,
+        args.command_arg,
+        args.command_args_json,
+        args.password,
+        args.client_cert,
+        args.client_key,
+        args.verify_cert,
+        args.concurrency,
+        (args.connect_timeout, args.read_timeout),
+        args.verbose,
+    )
+    for result in results:
+        print(json.dumps(result))
+    if any(result["status_code"] not in gg.REST_OK_STATUS_CODE for result in results):
+        sys.exit(1)
+
+
+"""
+"""
+if __name__ == "__main__":
+    main()
@@ -2,9 +2,20 @@
 
 import oracledb
 
+import common
+
+from contextlib import contextmanager
 from getpass import getpass
 from pprint import pprint as pp
-from common import common
+
+from collections import OrderedDict
+
+import io
+import itertools
+import json
+import os
+import re
+import threading
 
 
 """
@@ -12,6 +23,120 @@ Constants
 """
 LOB_DATATYPES = ["CLOB", "BLOB"]
 DBMS_OUTPUT_CHUNK_SIZE = 10
+# number of rows fetched per round trip by iter_sql if neither the call nor the db config set it
+DEFAULT_ITER_SQL_ARRAYSIZE = 1000
+# number of rows sent per round trip by execute_many
+DEFAULT_BATCH_SIZE = 1000
+# number of statements kept parsed by each connection, the default of the driver is 20
+DEFAULT_STMT_CACHE_SIZE = 100
+# number of rendered jinja2 sql kept by the sql registry
+SQL_REGISTRY_MAX_RENDERED = 1000
+# statements whose ; are part of a pl/sql block, they end with a line containing only /
+PLSQL_BLOCK_RE = re.compile(
+    r"\s*(DECLARE|BEGIN|CREATE\s+(OR\s+REPLACE\s+)?((NON)?EDITIONABLE\s+)?"
+    r"(FUNCTION|PROCEDURE|PACKAGE|TRIGGER|TYPE|LIBRARY))\b",
+    re.IGNORECASE,
+)
+# sql*plus commands, they take one line and are not sent to the db, except EXECUTE
+SQLPLUS_COMMAND_RE = re.compile(
+    r"(?P<command>@@?|(SET|SHOW?|SPO(OL)?|PRO(MPT)?|WHENEVER|DEF(INE)?|UNDEF(INE)?|REM(ARK)?|COL(UMN)?"
+    r"|TTITLE|BTITLE|BREAK|COMPUTE|CLEAR|CONN(ECT)?|DISC(ONNECT)?|EXIT|QUIT|PAUSE|ACCEPT"
+    r"|VAR(IABLE)?|PRINT|TIMING|HOST|DESC(RIBE)?|EXEC(UTE)?|START)\b)"
+    r"(?!\s+(TRANSACTION|ROLE|CONSTRAINTS?)\b)\s*(?P<args>.*?)[\s;]*$",
+    re.IGNORECASE | re.DOTALL,
+)
+# closing delimiter of the q'<delimiter>...<delimiter>' literals
+Q_QUOTE_CLOSING = {"[": "]", "{": "}", "(": ")", "<": ">"}
+# keys of the db config read by LazyDb, they are not passed to oracledb
+LAZYDB_CONFIG_KEYS = ["lazy", "pool_size", "arraysize", "prefetchrows"]
+
+
+"""
+splits a sql script given as lines (a file or any iterable) into statements, one statement is in memory at a time
+statements end with sep or with a line containing only /, the sep of quotes, comments and pl/sql blocks are ignored
+pl/sql blocks (BEGIN, DECLARE, CREATE PROCEDURE, ...) end only with a line containing only /
+the comments between statements and the sql*plus commands are skipped, EXECUTE is converted to a pl/sql block
+yields the statements without sep
+"""
+
+
+def iter_sql_statements(lines, sep=";"):
+    normal_re = re.compile(r"--|/\*|(?<![\w$#])[nN]?[qQ]'|'|\"|" + re.escape(sep))
+    parts = []
+    # True once the statement has some text, the comments before are skipped
+    started = False
+    is_block = None
+    # end of the quote or comment being read, None outside of them
+    closing = None
+    keep_closed = True
+    for line in lines:
+        if not closing:
+            stripped = line.strip()
+            if stripped == "/":
+                if started:
+                    yield "".join(parts).strip()
+                parts, started, is_block = [], False, None
+                continue
+            if not started:
+                match = SQLPLUS_COMMAND_RE.match(stripped)
+                if match:
+                    if match.group("command").upper().startswith("EXEC"):
+                        yield f"BEGIN {match.group('args')}; END;"
+                    continue
+        pos = 0
+        while pos < len(line):
+            if closing:
+                end = line.find(closing, pos)
+                if end < 0:
+                    if keep_closed:
+                        parts.append(line[pos:])
+                    break
+                end += len(closing)
+                if keep_closed:
+                    parts.append(line[pos:end])
+                closing = None
+                pos = end
+                continue
+            match = normal_re.search(line, pos)
+            if not match:
+                parts.append(line[pos:])
+                started = started or bool(line[pos:].strip())
+                break
+            text = line[pos : match.start()]
+            parts.append(text)
+            started = started or bool(text.strip())
+            token = match.group()
+            pos = match.end()
+            if token == "--":
+                if started:
+                    parts.append(line[match.start() :])
+                break
+            elif token == "/*":
+                closing, keep_closed = "*/", started
+                if started:
+                    parts.append(token)
+            elif token == sep:
+                if not started:
+                    continue
+                if is_block is None:
+                    is_block = bool(PLSQL_BLOCK_RE.match("".join(parts)))
+                if is_block:
+                    parts.append(token)
+                    continue
+                yield "".join(parts).strip()
+                parts, started, is_block = [], False, None
+            else:
+                started, keep_closed = True, True
+                if token in ("'", '"'):
+                    closing = token
+                elif pos < len(line):
+                    # q'[...]', the character after the quote is the delimiter
+                    token += line[pos]
+                    closing = Q_QUOTE_CLOSING.get(line[pos], line[pos]) + "'"
+                    pos += 1
+                parts.append(token)
+    if started:
+        yield "".join(parts).strip()
 
 
 """
@@ -19,8 +144,7 @@ DBMS_OUTPUT_CHUNK_SIZE = 10
 
 
 def convert_script2sql_commands(sql_script, sep=";"):
-    all_sqls = sql_script.split(sep)
-    return [sql for sql in all_sqls if not sql.isspace()]
+    return list(iter_sql_statements(io.StringIO(sql_script), sep))
 
 
 """
@@ -29,7 +153,7 @@ def convert_script2sql_commands(sql_script, sep=";"):
 
 def convert_sql_file2sql_commands(script_fn, sep=";"):
     with open(script_fn) as fh:
-        return convert_script2sql_commands(fh.read(), sep)
+        return list(iter_sql_statements(fh, sep))
 
 
 """
@@ -42,6 +166,82 @@ def read_sql_file(sql_fn):
     return sql
 
 
+"""
+memoizes the text of the sql files and of the rendered jinja2 sql for the whole process
+the same sql gets the same text, which is what the statement cache of the connections is looked up with
+"""
+
+
+class SqlRegistry:
+    def __init__(self, max_rendered=SQL_REGISTRY_MAX_RENDERED):
+        self.lock = threading.Lock()
+        self.max_rendered = max_rendered
+        # absolute path -> sql
+        self.files = {}
+        # (absolute path, rendering data as json) -> sql, least recently used first
+        self.rendered = OrderedDict()
+
+    """
+    returns the text of the sql file, the file is read only once
+    """
+
+    def get_sql_file(self, sql_fn):
+        key = os.path.abspath(sql_fn)
+        with self.lock:
+            if key in self.files:
+                return self.files[key]
+        sql = read_sql_file(key)
+        with self.lock:
+            return self.files.setdefault(key, sql)
+
+    """
+    returns the rendered jinja2 sql, the sql of the same template and rendering data is rendered only once
+    rendering data which can not be serialized as json is rendered every time
+    """
+
+    def render(self, sql_j2_template_fn, rendering_data=None):
+        j2_template = common.read_j2_template(sql_j2_template_fn)
+        try:
+            key = (
+                os.path.abspath(sql_j2_template_fn),
+                json.dumps(rendering_data, sort_keys=True),
+            )
+        except TypeError:
+            return j2_template.render(rendering_data)
+        with self.lock:
+            if key in self.rendered:
+                self.rendered.move_to_end(key)
+                return self.rendered[key]
+        sql = j2_template.render(rendering_data)
+        with self.lock:
+            self.rendered[key] = sql
+            if len(self.rendered) > self.max_rendered:
+                self.rendered.popitem(last=False)
+        return sql
+
+    """
+    forgets all sql, the files are read again on their next use
+    """
+
+    def clear(self):
+        with self.lock:
+            self.files.clear()
+            self.rendered.clear()
+
+
+SQL_REGISTRY = SqlRegistry()
+
+
+"""
+output_type_handler: to map CLOB to LONG
+"""
+
+
+def output_type_handler(cursor, name, default_type, size, precision, scale):
+    if default_type == oracledb.DB_TYPE_CLOB:
+        return cursor.var(oracledb.DB_TYPE_LONG, arraysize=cursor.arraysize)
+
+
 """
 """
 
@@ -56,9 +256,18 @@ class LazyDb:
     """
     """
 
-    def __init__(self, db_config):
+    def __init__(self, db_config, pool_size=None, lazy=False):
         self.db_config = db_config
-        self.conn = self.connect()
+        self.conn = None
+        self.pool = None
+        # with a pool_size a session pool is used, every operation acquires its own connection
+        self.pool_size = pool_size or db_config.get("pool_size")
+        self.lock = threading.Lock()
+        # the password is asked now and not by the thread of the first operation
+        self.set_db_pwd()
+        # in lazy mode the connection or the pool is only opened by the first operation
+        if not lazy and not db_config.get("lazy", False):
+            self.open()
 
     """
     """
@@ -70,8 +279,32 @@ class LazyDb:
     """
 
     def __exit__(self, exception_type, exception_value, exception_traceback):
-        if self.conn:
-            self.conn.close()
+        self.close()
+
+    """
+    opens the connection or the session pool if not done yet
+    """
+
+    def open(self):
+        with self.lock:
+            if self.pool_size:
+                if not self.pool:
+                    self.create_pool(self.pool_size)
+            elif not self.conn:
+                self.connect()
+
+    """
+    closes the connection and the session pool, the next operation opens them again
+    """
+
+    def close(self):
+        with self.lock:
+            if self.conn:
+                self.conn.close()
+                self.conn = None
+            if self.pool:
+                self.pool.close()
+                self.pool = None
 
     """
     """
@@ -105,71 +338,235 @@ class LazyDb:
             oracledb.init_oracle_client()
 
     """
+    returns the parameters of oracledb.connect and oracledb.create_pool
     """
 
-    def connect(self):
+    def get_connect_params(self):
+        params = {"stmtcachesize": DEFAULT_STMT_CACHE_SIZE}
+        params.update(
+            (key, value)
+            for key, value in self.db_config.items()
+            if key not in LAZYDB_CONFIG_KEYS
+        )
+        return params
+
+    """
+    """
+
+    def prepare_connect(self):
         self.set_db_pwd()
         self.set_db_mode()
         if not LazyDb.oracle_init_done:
             self.init_oracle_client()
             LazyDb.oracle_init_done = True
-        self.conn = oracledb.connect(**self.db_config)
-
-        """
-        output_type_handler: to map CLOB to LONG
-        """
 
-        def output_type_handler(cursor, name, default_type, size, precision, scale):
-            if default_type == oracledb.DB_TYPE_CLOB:
-                return cursor.var(oracledb.DB_TYPE_LONG, arraysize=cursor.arraysize)
+    """
+    """
 
+    def connect(self):
+        self.prepare_connect()
+        self.conn = oracledb.connect(**self.get_connect_params())
         self.conn.outputtypehandler = output_type_handler
         return self.conn
 
+    """
+    creates a session pool with up to pool_size connections
+    """
+
+    def create_pool(self, pool_size):
+        self.prepare_connect()
+        self.pool = oracledb.create_pool(
+            min=1, max=pool_size, increment=1, **self.get_connect_params()
+        )
+        return self.pool
+
+    """
+    yields a connection, from the pool if there is one
+    the connection is acquired for the operation and released to the pool at its end
+    """
+
+    @contextmanager
+    def connection(self):
+        self.open()
+        if self.pool:
+            with self.pool.acquire() as conn:
+                conn.outputtypehandler = output_type_handler
+                yield conn
+        else:
+            yield self.conn
+
+    """
+    returns the standalone connection, opened on the first call
+    with a session pool there is no connection spanning the operations, use connection() instead
+    """
+
+    def get_conn(self):
+        if self.pool_size:
+            raise Exception("no standalone connection with a session pool")
+        self.open()
+        return self.conn
+
     """
     """
 
     def commit(self):
-        self.conn.commit()
+        self.get_conn().commit()
 
     """
     """
 
     def rollback(self):
-        self.conn.rollback()
+        self.get_conn().rollback()
 
     """
     """
 
     def gettype(self, type_name):
-        return self.conn.gettype(type_name)
+        return self.get_conn().gettype(type_name)
 
     """
     """
 
     def get_cursor(self):
-        return self.conn.cursor()
+        return self.get_conn().cursor()
 
     """
+    executes the statements of the script one by one while it is read, see iter_sql_statements
     """
 
     def execute_sql_script(self, sql_script=None, sql_script_fn=None, sep=";"):
         assert sql_script or sql_script_fn, "at least one must be not given"
-        if sql_script:
-            sqlCommands = convert_script2sql_commands(sql_script, sep)
-        else:
-            sqlCommands = convert_sql_file2sql_commands(sql_script_fn, sep)
-        with self.get_cursor() as cursor:
-            for sql in sqlCommands:
-                if sql:
-                    try:
-                        cursor.execute(sql)
-                    except oracledb.Error as e:
-                        (error_obj,) = e.args
-                        print(f"Stmt failed:{sql}")
-                        print("Error Code:", error_obj.code)
-                        print("Error Message:", error_obj.message)
-                        raise e
+        with self.connection() as conn, conn.cursor() as cursor:
+            if sql_script:
+                self.execute_sql_statements(
+                    cursor, iter_sql_statements(io.StringIO(sql_script), sep)
+                )
+            else:
+                with open(sql_script_fn) as fh:
+                    self.execute_sql_statements(cursor, iter_sql_statements(fh, sep))
+
+    """
+    """
+
+    def execute_sql_statements(self, cursor, sql_statements):
+        for sql in sql_statements:
+            try:
+                cursor.execute(sql)
+            except oracledb.Error as e:
+                (error_obj,) = e.args
+                print(f"Stmt failed:{sql}")
+                print("Error Code:", error_obj.code)
+                print("Error Message:", error_obj.message)
+                raise e
+
+    """
+    executes the dml for all rows (tuples or dicts of binds) with cursor.executemany, one round trip per batch_size rows
+    rows can be any iterable, only one batch is in memory
+    with commit_interval the transaction is committed every time at least commit_interval rows were sent, and at the end
+    without commit_interval the caller commits the standalone connection, with a session pool the rows are always
+    committed at the end because the session is released (and rolled back) when execute_many returns
+    with batcherrors the failing rows are reported and the others processed, otherwise the first error is raised
+    with arraydmlrowcounts the number of rows affected by every row is returned
+    returns a dict with the number of rows and batches, the errors (offset of the row, message) and the rowcounts
+    """
+
+    def execute_many(
+        self,
+        sql,
+        rows,
+        batch_size=DEFAULT_BATCH_SIZE,
+        commit_interval=None,
+        batcherrors=False,
+        arraydmlrowcounts=False,
+    ):
+        result = {"rows": 0, "batches": 0, "errors": [], "rowcounts": []}
+        rows = iter(rows)
+        uncommitted_rows = 0
+        with self.connection() as conn, conn.cursor() as cursor:
+            while True:
+                batch = list(itertools.islice(rows, batch_size))
+                if not batch:
+                    break
+                try:
+                    cursor.executemany(
+                        sql,
+                        batch,
+                        batcherrors=batcherrors,
+                        arraydmlrowcounts=arraydmlrowcounts,
+                    )
+                except oracledb.Error as e:
+                    print(f"Stmt failed:{sql}")
+                    print(f"Batch starting at row: {result['rows']}")
+                    raise e
+                if batcherrors:
+                    result["errors"] += [
+                        (result["rows"] + error.offset, error.message)
+                        for error in cursor.getbatcherrors()
+                    ]
+                if arraydmlrowcounts:
+                    result["rowcounts"] += cursor.getarraydmlrowcounts()
+                result["rows"] += len(batch)
+                result["batches"] += 1
+                uncommitted_rows += len(batch)
+                if commit_interval and uncommitted_rows >= commit_interval:
+                    conn.commit()
+                    uncommitted_rows = 0
+            if uncommitted_rows and (commit_interval or self.pool):
+                conn.commit()
+        return result
+
+    """
+    inserts the rows into the columns of the table with execute_many, see execute_many for the options
+    """
+
+    def bulk_insert(
+        self,
+        table_name,
+        columns,
+        rows,
+        batch_size=DEFAULT_BATCH_SIZE,
+        commit_interval=None,
+        batcherrors=False,
+        arraydmlrowcounts=False,
+    ):
+        sql = (
+            f"INSERT INTO {table_name} ({', '.join(columns)}) "
+            f"VALUES ({', '.join(f':{i}' for i in range(1, len(columns) + 1))})"
+        )
+        return self.execute_many(
+            sql, rows, batch_size, commit_interval, batcherrors, arraydmlrowcounts
+        )
+
+    """
+    returns the sql given as text, file or jinja2 template, the files and templates come from the sql registry
+    """
+
+    def get_sql(
+        self, sql=None, sql_fn=None, sql_j2_template_fn=None, rendering_data=None
+    ):
+        if sql:
+            return sql
+        elif sql_fn:
+            return SQL_REGISTRY.get_sql_file(sql_fn)
+        elif sql_j2_template_fn:
+            return SQL_REGISTRY.render(sql_j2_template_fn, rendering_data)
+        raise Exception("no sql given")
+
+    """
+    sets the number of rows fetched per round trip (arraysize) and with the execute (prefetchrows)
+    the values of the call have precedence over the ones of the db config, the driver defaults are kept otherwise
+    """
+
+    def set_fetch_sizes(self, cursor, arraysize=None, prefetchrows=None):
+        if arraysize is None:
+            arraysize = self.db_config.get("arraysize")
+        if prefetchrows is None:
+            prefetchrows = self.db_config.get("prefetchrows")
+        if arraysize is not None:
+            cursor.arraysize = arraysize
+        # prefetchrows=0 is valid, it disables the prefetch of rows with the execute
+        if prefetchrows is not None:
+            cursor.prefetchrows = prefetchrows
 
     """
     """
@@ -185,18 +582,13 @@ class LazyDb:
         bind_data=None,
         print_dbms_output=False,
         dbms_output=[],
+        arraysize=None,
+        prefetchrows=None,
     ):
-        if sql:
-            None
-        elif sql_fn:
-            sql = read_sql_file(sql_fn)
-        elif sql_j2_template_fn:
-            j2_template = common.read_j2_template(sql_j2_template_fn)
-            sql = j2_template.render(rendering_data)
-        else:
-            raise Exception("no sql given")
+        sql = self.get_sql(sql, sql_fn, sql_j2_template_fn, rendering_data)
 
-        with self.get_cursor() as cursor:
+        with self.connection() as conn, conn.cursor() as cursor:
+            self.set_fetch_sizes(cursor, arraysize, prefetchrows)
             if print_dbms_output:
                 cursor.callproc("dbms_output.enable", [None])
             try:
@@ -226,3 +618,40 @@ class LazyDb:
                 if bind_data:
                     pp(bind_data)
                 raise e
+
+    """
+    yields the rows of a query, fetched in batches of arraysize rows from an open cursor
+    only one batch is in memory, the connection is held until the generator is exhausted or closed
+    """
+
+    def iter_sql(
+        self,
+        sql=None,
+        sql_fn=None,
+        sql_j2_template_fn=None,
+        rendering_data=None,
+        bind_data=None,
+        arraysize=None,
+        prefetchrows=None,
+    ):
+        sql = self.get_sql(sql, sql_fn, sql_j2_template_fn, rendering_data)
+        arraysize = (
+            arraysize or self.db_config.get("arraysize") or DEFAULT_ITER_SQL_ARRAYSIZE
+        )
+        with self.connection() as conn, conn.cursor() as cursor:
+            self.set_fetch_sizes(cursor, arraysize, prefetchrows)
+            try:
+                if bind_data:
+                    cursor.execute(sql, bind_data)
+                else:
+                    cursor.execute(sql)
+                while True:
+                    rows = cursor.fetchmany(arraysize)
+                    if not rows:
+                        break
+                    yield from rows
+            except oracledb.Error as e:
+                print(sql)
+                if bind_data:
+                    pp(bind_data)
+                raise e
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+
+"""
+Manifest of the generated prm files, to detect which inputs and files changed between runs
+"""
+
+import hashlib
+import json
+import os
+
+import common
+
+
+"""
+Constants
+"""
+MANIFEST_FILE_NAME_TEMPLATE = "prm_manifest_{env}.json"
+FILE_HASH_CHUNK_SIZE = 1024 * 1024
+
+
+"""
+returns the hash of a json serializable value
+"""
+
+
+def hash_value(value) -> str:
+    return hashlib.sha1(
+        json.dumps(value, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+"""
+returns the sha256 of the content of the file, None if the file does not exist
+"""
+
+
+def hash_file(fn: str) -> str | None:
+    if not os.path.exists(fn):
+        return None
+    file_hash = hashlib.sha256()
+    with open(fn, "rb") as fh:
+        while chunk := fh.read(FILE_HASH_CHUNK_SIZE):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+"""
+"""
+
+
+class PrmManifest:
+    def __init__(self, cache_dir: str, env: str, verbose: bool = False):
+        self.verbose = verbose
+        common.checkDir(cache_dir)
+        self.manifest_fn = os.path.join(
+            cache_dir, MANIFEST_FILE_NAME_TEMPLATE.format(env=env)
+        )
+        self.manifest = {"processes": {}, "changed_files": []}
+        if os.path.exists(self.manifest_fn):
+            self.manifest = common.read_json(self.manifest_fn)
+
+    """
+    returns True if the inputs of the process did not change and its files are still the generated ones
+    """
+
+    def is_unchanged(self, process_key: str, inputs_hash: str) -> bool:
+        process_entry = self.manifest["processes"].get(process_key)
+        if not process_entry or process_entry["inputs_hash"] != inputs_hash:
+            return False
+        return all(
+            hash_file(fn) == file_hash
+            for fn, file_hash in process_entry["files"].items()
+        )
+
+    """
+    returns the table files of the process recorded by the last run
+    """
+
+    def get_table_files(self, process_key: str) -> list[str]:
+        return self.manifest["processes"][process_key]["table_files"]
+
+    """
+    prints which tables of the process were added, removed or changed since the last run, only in verbose mode
+    """
+
+    def report_tables(self, process_key: str, table_hashes: dict[str, str]):
+        if not self.verbose:
+            return
+        process_entry = self.manifest["processes"].get(process_key)
+        previous_table_hashes = process_entry["tables"] if process_entry else {}
+        added = table_hashes.keys() - previous_table_hashes.keys()
+        removed = previous_table_hashes.keys() - table_hashes.keys()
+        changed = [
+            table
+            for table in table_hashes.keys() & previous_table_hashes.keys()
+            if table_hashes[table] != previous_table_hashes[table]
+        ]
+        print(
+            f"process: {process_key} tables added: {len(added)} removed: {len(removed)} changed: {len(changed)}"
+        )
+        for table in sorted(added):
+            print(f"added: {table}")
+        for table in sorted(removed):
+            print(f"removed: {table}")
+        for table in sorted(changed):
+            print(f"changed: {table}")
+
+    """
+    records the inputs and the generated files of the process
+    """
+
+    def update(
+        self,
+        process_key: str,
+        inputs_hash: str,
+        table_hashes: dict[str, str],
+        table_files: list[str],
+    ):
+        self.manifest["processes"][process_key] = {
+            "inputs_hash": inputs_hash,
+            "tables": table_hashes,
+            "table_files": table_files,
+            "files": {fn: hash_file(fn) for fn in table_files},
+        }
+
+    """
+    writes the manifest, changed_files is the report of the files written by this run
+    """
+
+    def save(self, changed_files: list[str]):
+        self.manifest["changed_files"] = changed_files
+        common.write_json(self.manifest, self.manifest_fn)
@@ -0,0 +1,413 @@
+#!/usr/bin/env python
+
+"""
+Bulk loader for the dictionary metadata of the replicated tables
+"""
+
+import json
+import os
+import sqlite3
+
+import common
+import lazydb
+
+
+"""
+Constants
+"""
+# oracle allows at most 1000 expressions in an IN list
+MAX_IN_LIST_SIZE = 1000
+DEFAULT_METADATA_CACHE_DIR = common.DEFAULT_CACHE_DIR
+TABLE_WEIGHTS = ["table_count", "segment_size", "dml_rate"]
+METADATA_CACHE_FILE_NAME = "metadata.sqlite"
+# the dictionary queries fetch many rows per round trip, a query returning at most one row per table of an
+# IN list is fetched completely with the execute
+METADATA_FETCH_ARRAYSIZE = 1000
+METADATA_PREFETCHROWS = MAX_IN_LIST_SIZE + 1
+
+
+"""
+yields the given list in chunks of at most chunk_size elements
+"""
+
+
+def chunks(items: list, chunk_size: int):
+    for i in range(0, len(items), chunk_size):
+        yield items[i : i + chunk_size]
+
+
+"""
+groups the (owner, table_name) pairs by owner, keeping the input order and removing duplicates
+"""
+
+
+def group_by_owner(owner_table_names) -> dict[str, list[str]]:
+    owners = {}
+    for owner, table_name in owner_table_names:
+        owners.setdefault(owner, {})[table_name] = None
+    return {owner: list(table_names) for owner, table_names in owners.items()}
+
+
+"""
+generates the bind variables for an IN list, returns the placeholders and the bind data
+"""
+
+
+def gen_in_list_binds(values: list[str], prefix: str = "b") -> tuple[str, dict]:
+    bind_data = {f"{prefix}{i}": value for i, value in enumerate(values)}
+    placeholders = ", ".join(f":{bind_name}" for bind_name in bind_data)
+    return placeholders, bind_data
+
+
+"""
+persistent cache of table metadata, every entry is stamped with the last_ddl_time of the table
+and only valid as long as the table has not changed
+"""
+
+
+class MetadataCache:
+    def __init__(
+        self,
+        db_conn: lazydb.LazyDb,
+        db_name: str,
+        cache_dir: str = DEFAULT_METADATA_CACHE_DIR,
+        verbose: bool = False,
+        workers: int = 1,
+    ):
+        self.db_conn = db_conn
+        self.db_name = db_name
+        self.verbose = verbose
+        self.workers = workers
+        # (owner, table_name) -> last_ddl_time as string
+        self.last_ddl_times = {}
+        common.checkDir(cache_dir)
+        self.cache_conn = sqlite3.connect(
+            os.path.join(cache_dir, METADATA_CACHE_FILE_NAME)
+        )
+        self.cache_conn.execute(
+            """
+CREATE TABLE IF NOT EXISTS table_metadata (
+    db_name TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    table_name TEXT NOT NULL,
+    last_ddl_time TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (db_name, kind, owner, table_name)
+)
+"""
+        )
+
+    """
+    """
+
+    def __enter__(self):
+        return self
+
+    """
+    """
+
+    def __exit__(self, exception_type, exception_value, exception_traceback):
+        self.close()
+
+    """
+    """
+
+    def close(self):
+        self.cache_conn.close()
+
+    """
+    returns the last_ddl_time of all the given tables of one owner
+    """
+
+    def exec_sql_get_last_ddl_times(self, owner: str, table_names: list[str]) -> list:
+        placeholders, bind_data = gen_in_list_binds(table_names)
+        sql = f"""
+SELECT object_name, last_ddl_time
+  FROM dba_objects
+ WHERE owner = :owner
+   AND object_type = 'TABLE'
+   AND object_name IN ({placeholders})
+"""
+        return self.db_conn.execute_sql(
+            sql=sql,
+            bind_data={"owner": owner, **bind_data},
+            arraysize=METADATA_FETCH_ARRAYSIZE,
+            prefetchrows=METADATA_PREFETCHROWS,
+        )
+
+    """
+    loads the last_ddl_time of the given tables which are not loaded yet
+    """
+
+    def load_last_ddl_times(self, owner_table_names: list[tuple[str, str]]):
+        owner_table_names = [
+            owner_table_name
+            for owner_table_name in owner_table_names
+            if owner_table_name not in self.last_ddl_times
+        ]
+        owner_chunks = [
+            (owner, table_names_chunk)
+            for owner, table_names in group_by_owner(owner_table_names).items()
+            for table_names_chunk in chunks(table_names, MAX_IN_LIST_SIZE)
+        ]
+        all_rows = common.ordered_map(
+            lambda owner_chunk: self.exec_sql_get_last_ddl_times(*owner_chunk),
+            owner_chunks,
+            self.workers,
+        )
+        for (owner, table_names_chunk), rows in zip(owner_chunks, all_rows):
+            # tables which do not exist have no last_ddl_time and are never cached
+            for table_name in table_names_chunk:
+                self.last_ddl_times[(owner, table_name)] = None
+            for table_name, last_ddl_time in rows:
+                self.last_ddl_times[(owner, table_name)] = str(last_ddl_time)
+
+    """
+    returns a dict with the valid cached values of the given kind and the list of tables to be queried
+    """
+
+    def get_valid(
+        self, kind: str, owner_table_names: list[tuple[str, str]]
+    ) -> tuple[dict, list]:
+        self.load_last_ddl_times(owner_table_names)
+        cached = {}
+        for owner, table_name, last_ddl_time, value in self.cache_conn.execute(
+            """
+SELECT owner, table_name, last_ddl_time, value
+  FROM table_metadata
+ WHERE db_name = ?
+   AND kind = ?
+""",
+            (self.db_name, kind),
+        ):
+            cached[(owner, table_name)] = (last_ddl_time, value)
+        valid = {}
+        missing = []
+        for owner_table_name in owner_table_names:
+            last_ddl_time = self.last_ddl_times[owner_table_name]
+            entry = cached.get(owner_table_name)
+            if last_ddl_time and entry and entry[0] == last_ddl_time:
+                valid[owner_table_name] = json.loads(entry[1])
+            else:
+                missing.append(owner_table_name)
+        if self.verbose:
+            print(
+                f"metadata cache {kind}: {len(valid)} valid, {len(missing)} to be queried"
+            )
+        return valid, missing
+
+    """
+    stores the values of the given kind, stamped with the last_ddl_time of each table
+    """
+
+    def put(self, kind: str, values: dict):
+        self.cache_conn.executemany(
+            """
+INSERT OR REPLACE INTO table_metadata
+       (db_name, kind, owner, table_name, last_ddl_time, value)
+VALUES (?, ?, ?, ?, ?, ?)
+""",
+            [
+                (
+                    self.db_name,
+                    kind,
+                    owner,
+                    table_name,
+                    self.last_ddl_times[(owner, table_name)],
+                    json.dumps(value),
+                )
+                for (owner, table_name), value in values.items()
+                if self.last_ddl_times.get((owner, table_name))
+            ],
+        )
+        self.cache_conn.commit()
+
+
+"""
+weight of the tables, used to balance the tables across several processes
+segment_size: size in bytes of the table, partitions and lobs
+dml_rate: number of inserts, updates and deletes since the last statistics
+table_count: every table has the same weight
+"""
+
+
+class TableWeights:
+    def __init__(
+        self,
+        db_conn: lazydb.LazyDb,
+        weight: str = "table_count",
+        verbose: bool = False,
+        workers: int = 1,
+    ):
+        if weight not in TABLE_WEIGHTS:
+            raise Exception(f"weight: {weight} not implemented")
+        self.db_conn = db_conn
+        self.weight = weight
+        self.verbose = verbose
+        self.workers = workers
+
+    """
+    returns the weight of all the given tables of one owner
+    """
+
+    def exec_sql_get_tables_weights(self, owner: str, table_names: list[str]) -> list:
+        placeholders, bind_data = gen_in_list_binds(table_names)
+        if self.weight == "segment_size":
+            sql = f"""
+SELECT table_name, SUM(bytes)
+  FROM (SELECT segment_name table_name, bytes
+          FROM dba_segments
+         WHERE owner = :owner
+           AND segment_type IN ('TABLE', 'TABLE PARTITION', 'TABLE SUBPARTITION')
+           AND segment_name IN ({placeholders})
+        UNION ALL
+        SELECT l.table_name, s.bytes
+          FROM dba_lobs l
+          JOIN dba_segments s
+            ON s.owner = l.owner
+           AND s.segment_name = l.segment_name
+         WHERE l.owner = :owner
+           AND l.table_name IN ({placeholders}))
+ GROUP BY table_name
+"""
+        else:
+            sql = f"""
+SELECT table_name, SUM(inserts + updates + deletes)
+  FROM dba_tab_modifications
+ WHERE table_owner = :owner
+   AND partition_name IS NULL
+   AND table_name IN ({placeholders})
+ GROUP BY table_name
+"""
+        return self.db_conn.execute_sql(
+            sql=sql,
+            bind_data={"owner": owner, **bind_data},
+            arraysize=METADATA_FETCH_ARRAYSIZE,
+            prefetchrows=METADATA_PREFETCHROWS,
+        )
+
+    """
+    returns a dict (owner, table_name) -> weight for the given tables, tables without data weigh 0
+    """
+
+    def load(self, tables_list: list) -> dict[tuple[str, str], int]:
+        weights = {(table.owner, table.table_name): 0 for table in tables_list}
+        if self.weight == "table_count":
+            return {owner_table_name: 1 for owner_table_name in weights}
+        owner_chunks = [
+            (owner, table_names_chunk)
+            for owner, table_names in group_by_owner(weights).items()
+            for table_names_chunk in chunks(table_names, MAX_IN_LIST_SIZE)
+        ]
+        if self.verbose:
+            print(
+                f"getting {self.weight} for {len(weights)} tables with {len(owner_chunks)} queries"
+            )
+        all_rows = common.ordered_map(
+            lambda owner_chunk: self.exec_sql_get_tables_weights(*owner_chunk),
+            owner_chunks,
+            self.workers,
+        )
+        for (owner, _), rows in zip(owner_chunks, all_rows):
+            for table_name, weight in rows:
+                weights[(owner, table_name)] = weight or 0
+        return weights
+
+
+"""
+in-memory index of the columns of the tables, loaded with a few set-based queries
+"""
+
+
+class TableColumns:
+    def __init__(
+        self,
+        db_conn: lazydb.LazyDb,
+        verbose: bool = False,
+        metadata_cache: MetadataCache = None,
+        workers: int = 1,
+    ):
+        self.db_conn = db_conn
+        self.verbose = verbose
+        self.metadata_cache = metadata_cache
+        self.workers = workers
+        # (owner, table_name) -> [(column_name, data_type, data_length), ...]
+        self.columns = {}
+
+    """
+    returns a dict table_name -> columns ordered by column_id for all the given tables of one owner
+    """
+
+    def exec_sql_get_tables_columns(
+        self, owner: str, table_names: list[str]
+    ) -> dict[str, list]:
+        placeholders, bind_data = gen_in_list_binds(table_names)
+        sql = f"""
+SELECT table_name, column_name, data_type, data_length
+  FROM dba_tab_columns
+ WHERE owner = :owner
+   AND table_name IN ({placeholders})
+ ORDER BY table_name, column_id
+"""
+        # the rows are streamed into the index, the result set is never materialized
+        columns = {table_name: [] for table_name in table_names}
+        for table_name, column_name, data_type, data_length in self.db_conn.iter_sql(
+            sql=sql,
+            bind_data={"owner": owner, **bind_data},
+            arraysize=METADATA_FETCH_ARRAYSIZE,
+        ):
+            columns[table_name].append((column_name, data_type, data_length))
+        return columns
+
+    """
+    loads the columns of all the given tables which are not loaded yet
+    """
+
+    def load(self, tables_list: list):
+        owner_table_names = [
+            (table.owner, table.table_name)
+            for table in tables_list
+            if (table.owner, table.table_name) not in self.columns
+        ]
+        if self.metadata_cache:
+            cached_columns, owner_table_names = self.metadata_cache.get_valid(
+                "columns", owner_table_names
+            )
+            for owner_table_name, columns in cached_columns.items():
+                self.columns[owner_table_name] = [tuple(column) for column in columns]
+        owner_chunks = [
+            (owner, table_names_chunk)
+            for owner, table_names in group_by_owner(owner_table_names).items()
+            for table_names_chunk in chunks(table_names, MAX_IN_LIST_SIZE)
+        ]
+        if self.verbose:
+            print(
+                f"getting columns for {len(owner_table_names)} tables with {len(owner_chunks)} queries"
+            )
+        # the queries run in parallel, the results are stored in this thread
+        all_columns = common.ordered_map(
+            lambda owner_chunk: self.exec_sql_get_tables_columns(*owner_chunk),
+            owner_chunks,
+            self.workers,
+        )
+        for (owner, table_names_chunk), columns in zip(owner_chunks, all_columns):
+            for table_name in table_names_chunk:
+                self.columns[(owner, table_name)] = columns[table_name]
+            if self.metadata_cache:
+                self.metadata_cache.put(
+                    "columns",
+                    {
+                        (owner, table_name): self.columns[(owner, table_name)]
+                        for table_name in table_names_chunk
+                    },
+                )
+
+    """
+    returns the columns of the table, the table is loaded if it is not in the index
+    """
+
+    def get(self, table) -> list:
+        if (table.owner, table.table_name) not in self.columns:
+            self.load([table])
+        return self.columns[(table.owner, table.table_name)]